@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Set, List, Optional
+
+from injector import inject
+
+from events_processor.configtools import ConfigProvider
+from events_processor.interfaces import SystemTime, AlarmBoxReader
+from events_processor.models import FrameInfo, EventInfo, FrameQueue
+from events_processor.reader import FrameReader, FrameReaderWorker
+
+
+class AsyncFrameReaderWorker(FrameReaderWorker):
+    log = logging.getLogger("events_processor.AsyncFrameReaderWorker")
+
+    @inject
+    def __init__(self,
+                 config: ConfigProvider,
+                 frame_queue: FrameQueue,
+                 system_time: SystemTime,
+                 frame_reader: FrameReader,
+                 alarm_box_reader: AlarmBoxReader):
+        super().__init__(config, frame_queue, system_time, frame_reader, alarm_box_reader)
+        self._pending_tasks: Set[asyncio.Future] = set()
+
+    def run(self) -> None:
+        asyncio.run(self._run())
+        self.log.info("Terminating")
+
+    async def _run(self) -> None:
+        executor = ThreadPoolExecutor(max_workers=self._config.ingestion_io_threads,
+                                      thread_name_prefix='AsyncFrameReaderWorker')
+        asyncio.get_running_loop().set_default_executor(executor)
+
+        while not self._stop_requested:
+            before = time.monotonic()
+            try:
+                await self._collect_events_async()
+            except Exception:
+                self.log.exception("Could not collect events")
+            time_spent = (time.monotonic() - before)
+            await self._in_executor(self._system_time.sleep, max(self._config.event_loop_seconds - time_spent, 0))
+
+    async def _in_executor(self, fn: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self._pending_tasks.add(task)
+        task.add_done_callback(self._pending_tasks.discard)
+
+    async def _collect_events_async(self) -> None:
+        polled_events = await self._in_executor(self._poll_event_list)
+        events_frames = await self._in_executor(self._frame_reader.frames_many, polled_events)
+        for (event_info, frames) in zip(polled_events, events_frames):
+            await self._collect_frames_async(event_info, frames)
+
+    async def _collect_frames_async(self, event_info: EventInfo, frames: Optional[List[FrameInfo]]) -> None:
+        self.log.info(f"Reading event frames: {event_info}")
+
+        if frames is not None:
+            (settled_frames, pending_frames) = self._split_settled_frames(event_info, frames)
+            await self._in_executor(self._enqueue_frames, event_info, settled_frames)
+
+            self._mark_retrieved(event_info, pending_frames)
+            for frame_info in pending_frames:
+                self._spawn(self._enqueue_when_settled(frame_info))
+
+            if event_info.end_time is not None:
+                event_info.all_frames_were_read = True
+
+    async def _enqueue_when_settled(self, frame_info: FrameInfo) -> None:
+        await asyncio.sleep(self._frame_settle_seconds(frame_info))
+
+        event_info = frame_info.event_info
+        if not event_info.notification_status.was_submitted:
+            alarm_box = await self._in_executor(self._alarm_box_reader.read,
+                                                frame_info.event_id,
+                                                frame_info.frame_id,
+                                                self._config.excluded_zone_prefix)
+            with event_info.lock:
+                event_info.alarm_boxes[frame_info.frame_id] = alarm_box
+
+        self._frame_queue.put(frame_info)
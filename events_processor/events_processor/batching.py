@@ -0,0 +1,114 @@
+import logging
+import time
+from itertools import groupby
+from queue import Queue, Empty
+from threading import Thread, Event
+from typing import Any, List, Optional
+
+from injector import inject
+
+from events_processor.configtools import ConfigProvider
+from events_processor.interfaces import Engine
+
+_RESULT_TIMEOUT_SECONDS = 60
+
+
+class BatchRequest:
+    def __init__(self, tensor: Any, threshold: float):
+        self.tensor = tensor
+        self.threshold = threshold
+        self.result: Any = None
+        self.error: Optional[Exception] = None
+        self.done = Event()
+
+
+class InferenceBatcher(Thread):
+    log = logging.getLogger("events_processor.InferenceBatcher")
+    result_timeout_seconds: float = _RESULT_TIMEOUT_SECONDS
+
+    @inject
+    def __init__(self, config: ConfigProvider, engine: Engine):
+        super().__init__()
+        self._stop_requested = False
+
+        self._config = config
+        self._engine = engine
+        self._requests: Queue = Queue()
+
+    @property
+    def enabled(self) -> bool:
+        return self._config.inference_batch_size > 1
+
+    def detect_batch(self, tensors: List[Any], threshold: float) -> List[Any]:
+        if not self.enabled or self._stop_requested or not self.is_alive():
+            return self._engine.detect_batch(tensors, threshold)
+
+        requests = [BatchRequest(tensor, threshold) for tensor in tensors]
+        for request in requests:
+            self._requests.put(request)
+
+        deadline = time.monotonic() + self.result_timeout_seconds
+        for request in requests:
+            if not request.done.wait(max(deadline - time.monotonic(), 0)):
+                raise TimeoutError(f"No batched inference result within {self.result_timeout_seconds} seconds")
+            if request.error is not None:
+                raise request.error
+
+        return [request.result for request in requests]
+
+    def run(self) -> None:
+        while not self._stop_requested:
+            request = self._requests.get()
+            if self._stop_requested:
+                break
+
+            self._run_batch(self._collect_batch(request))
+
+        self._fail_pending_requests()
+        self.log.info("Terminating")
+
+    def stop(self) -> None:
+        self._stop_requested = True
+        self._requests.put(None)
+
+    def _fail_pending_requests(self) -> None:
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except Empty:
+                return
+
+            if request is not None:
+                request.error = RuntimeError("Inference batcher stopped")
+                request.done.set()
+
+    def _collect_batch(self, first_request: BatchRequest) -> List[BatchRequest]:
+        batch = [first_request]
+        deadline = time.monotonic() + self._config.inference_batch_timeout_ms / 1000
+        while len(batch) < self._config.inference_batch_size:
+            try:
+                request = self._requests.get(timeout=max(deadline - time.monotonic(), 0))
+            except Empty:
+                break
+
+            if request is None:
+                self._requests.put(None)
+                break
+            batch.append(request)
+
+        return batch
+
+    def _run_batch(self, batch: List[BatchRequest]) -> None:
+        for (threshold, group) in groupby(sorted(batch, key=lambda r: r.threshold), key=lambda r: r.threshold):
+            requests = list(group)
+            try:
+                results = self._engine.detect_batch([r.tensor for r in requests], threshold)
+                for (request, result) in zip(requests, results):
+                    request.result = result
+            except Exception as e:
+                self.log.exception("Batched inference failed")
+                for request in requests:
+                    request.error = e
+            finally:
+                for request in requests:
+                    request.done.set()
@@ -1,21 +1,32 @@
 from queue import Queue
 
-from injector import Module, Binder, singleton
+from injector import Module, Binder, singleton, provider, ProviderOf
 
+from events_processor.asyncreader import AsyncFrameReaderWorker
+from events_processor.batching import InferenceBatcher
+from events_processor.bufferpool import ImageBufferPool
 from events_processor.configtools import ConfigProvider
 from events_processor.controller import MainController, DefaultSystemTime
-from events_processor.dataaccess import DBZoneReader, DBAlarmBoxReader, DBMonitorReader
+from events_processor.dataaccess import DBZoneReader, DBAlarmBoxReader, DBMonitorReader, DBFrameReader, \
+    ConnectionPool
+from events_processor.detectioncache import CachingDetectionEngine, CachedEngine
 from events_processor.detector import CoralDetector, SynchronizedDetectionEngine
+from events_processor.cpuengine import TFLiteDetectionEngine
+from events_processor.enginepool import EnginePool, EngineInstance, OverflowEngineInstance
 from events_processor.filters import DetectionFilter
+from events_processor.imagestore import CandidateImageStore
 from events_processor.interfaces import Detector, NotificationSender, ImageReader, SystemTime, ZoneReader, \
     ResourceReader, AlarmBoxReader, Engine, MonitorReader
-from events_processor.models import NotificationQueue, FrameQueue
+from events_processor.models import NotificationQueue, FrameQueue, FramePriorityQueue, DecodedFrameQueue, \
+    PreprocessedFrameQueue
 from events_processor.notifications import MailNotificationSender, NotificationWorker, FSNotificationSender, \
     DetectionNotifier, EventUpdater
 from events_processor.preprocessor import RotatingPreprocessor
-from events_processor.processor import FSImageReader, FrameProcessorWorker
-from events_processor.reader import FrameReader, WebResourceReader, FrameReaderWorker
+from events_processor.processor import FSImageReader, FrameProcessorWorker, FrameImageLoader, FrameDecodeWorker, \
+    FramePreprocessWorker
+from events_processor.reader import FrameReader, WebResourceReader, FrameReaderWorker, HttpClient
 from events_processor.renderer import DetectionRenderer
+from events_processor.suppression import DuplicateDetectionSuppressor
 
 
 class AppBindingsModule(Module):
@@ -24,21 +35,34 @@ class AppBindingsModule(Module):
         binder.bind(FrameReader)
         binder.bind(MainController)
         binder.bind(DetectionFilter)
+        binder.bind(DuplicateDetectionSuppressor)
         binder.bind(RotatingPreprocessor)
         binder.bind(DetectionNotifier)
         binder.bind(EventUpdater)
         binder.bind(DetectionRenderer)
+        binder.bind(FrameImageLoader)
 
         binder.bind(ConfigProvider, scope=singleton)
+        binder.bind(ConnectionPool, scope=singleton)
+        binder.bind(HttpClient, scope=singleton)
+        binder.bind(ImageBufferPool, scope=singleton)
+        binder.bind(CandidateImageStore, scope=singleton)
+        binder.bind(InferenceBatcher, scope=singleton)
 
         binder.bind(FrameReaderWorker)
+        binder.bind(AsyncFrameReaderWorker)
+        binder.bind(FrameDecodeWorker)
+        binder.bind(FramePreprocessWorker)
         binder.bind(FrameProcessorWorker)
         binder.bind(NotificationWorker)
 
         binder.bind(NotificationQueue, to=Queue())
-        binder.bind(FrameQueue, to=Queue())
+        binder.bind(FrameQueue, to=FrameQueue(FramePriorityQueue()))
 
-        binder.bind(Engine, SynchronizedDetectionEngine, scope=singleton)
+        binder.bind(Engine, to=CachingDetectionEngine, scope=singleton)
+        binder.bind(EnginePool)
+        binder.bind(SynchronizedDetectionEngine)
+        binder.bind(TFLiteDetectionEngine)
         binder.bind(Detector, to=CoralDetector)
         binder.bind(NotificationSender, to=MailNotificationSender)
         binder.bind(ImageReader, to=FSImageReader)
@@ -48,7 +72,42 @@ class AppBindingsModule(Module):
         binder.bind(AlarmBoxReader, to=DBAlarmBoxReader)
         binder.bind(MonitorReader, to=DBMonitorReader)
 
+    @provider
+    def provide_engine_instance(self,
+                                config: ConfigProvider,
+                                edgetpu_engine_provider: ProviderOf[SynchronizedDetectionEngine],
+                                cpu_engine_provider: ProviderOf[TFLiteDetectionEngine]) -> EngineInstance:
+        if config.engine_backend == 'cpu':
+            return EngineInstance(cpu_engine_provider.get())
+        return EngineInstance(edgetpu_engine_provider.get())
+
+    @provider
+    def provide_overflow_engine_instance(self,
+                                         cpu_engine_provider: ProviderOf[TFLiteDetectionEngine]
+                                         ) -> OverflowEngineInstance:
+        return OverflowEngineInstance(cpu_engine_provider.get())
+
+    @singleton
+    @provider
+    def provide_cached_engine(self, engine_pool: EnginePool) -> CachedEngine:
+        return CachedEngine(engine_pool)
+
+    @singleton
+    @provider
+    def provide_decoded_frame_queue(self, config: ConfigProvider) -> DecodedFrameQueue:
+        return DecodedFrameQueue(Queue(config.stage_queue_size))
+
+    @singleton
+    @provider
+    def provide_preprocessed_frame_queue(self, config: ConfigProvider) -> PreprocessedFrameQueue:
+        return PreprocessedFrameQueue(Queue(config.stage_queue_size))
+
 
 class FSNotificationSenderOverride(Module):
     def configure(self, binder: Binder) -> None:
         binder.bind(NotificationSender, to=FSNotificationSender)
+
+
+class DBFrameReaderOverride(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(FrameReader, to=DBFrameReader)
@@ -0,0 +1,56 @@
+import logging
+from threading import Lock
+from typing import Dict, List, Tuple, Any, Optional
+
+import numpy as np
+from injector import inject
+
+from events_processor.configtools import ConfigProvider
+
+
+class ImageBufferPool:
+    log = logging.getLogger("events_processor.ImageBufferPool")
+
+    @inject
+    def __init__(self, config: ConfigProvider):
+        self._config = config
+        self._lock = Lock()
+        self._buckets: Dict[Tuple[Tuple[int, ...], str], List[Any]] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def acquire(self, shape: Tuple[int, ...], dtype: Any = np.uint8) -> Any:
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket:
+                self._hits += 1
+                return bucket.pop()
+            self._misses += 1
+
+        return np.empty(shape, dtype)
+
+    def release(self, array: Optional[Any]) -> None:
+        if array is None or not self._is_poolable(array):
+            return
+
+        key = (array.shape, array.dtype.str)
+        with self._lock:
+            bucket = self._buckets.setdefault(key, [])
+            if len(bucket) < self._config.buffers_per_size and not any(b is array for b in bucket):
+                bucket.append(array)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'pooled': sum(len(bucket) for bucket in self._buckets.values()),
+                'pooled_bytes': sum(b.nbytes for bucket in self._buckets.values() for b in bucket),
+            }
+
+    @staticmethod
+    def _is_poolable(array: Optional[Any]) -> bool:
+        return isinstance(array, np.ndarray) and array.base is None and array.flags.c_contiguous \
+               and array.flags.writeable
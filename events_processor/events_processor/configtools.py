@@ -41,7 +41,11 @@ class ConfigProvider(ConfigParser):
         self._monitor_id_for_name = {m.name: m.id for m in self._monitor_reader.read()}
 
         self.event_list_url = self._read_property('zm', 'event_list_url')
+        self.event_list_from_id_url = self._read_property('zm', 'event_list_from_id_url')
+        self.incremental_event_polling = \
+            self._read_property('zm', 'incremental_event_polling', 'no', transform=str_to_bool)
         self.event_details_url = self._read_property('zm', 'event_details_url')
+        self.frame_list_url = self._read_property('zm', 'frame_list_url')
         self.frame_jpg_path = self._read_property('zm', 'frame_jpg_path')
 
         self.notification_delay_seconds = \
@@ -52,12 +56,37 @@ class ConfigProvider(ConfigParser):
         self.cache_seconds_buffer = self._read_property('timings', 'cache_seconds_buffer', '120', transform=int)
 
         self.rotations = self._read_map('rotating_preprocessor', 'rotate', int)
+        self.rotation_modes = self._read_map('rotating_preprocessor', 'mode')
+        self.rotation_interpolations = self._read_map('rotating_preprocessor', 'interpolation')
 
         self.detector_model_file = self._read_property('coral', 'model_file')
         self.min_score = self._read_property('coral', 'min_score', transform=float)
         self.detection_chunks = self._read_map('coral', 'detection_chunks', extract_int_pair)
+        self.min_object_sizes = self._read_map('coral', 'min_object_size', int)
+        self.max_object_sizes = self._read_map('coral', 'max_object_size', int)
+        self.min_object_input_pixels = self._read_property('coral', 'min_object_input_pixels', '20', transform=float)
+        self.max_inferred_frames = self._read_map('coral', 'max_inferred_frames', int)
+        self.decode_reductions = self._read_map('coral', 'decode_reduction')
+        self.engine_count = self._read_property('coral', 'engine_count', '1', transform=int)
+        self.engine_backend = self._read_property('coral', 'engine_backend', 'edgetpu')
+        self.cpu_model_file = self._read_property('coral', 'cpu_model_file',
+                                                  'mobilenet_ssd_v2_coco_quant_postprocess.tflite')
+        self.cpu_threads_per_engine = self._read_property('coral', 'cpu_threads_per_engine', '1', transform=int)
+        self.overflow_engine_count = self._read_property('coral', 'overflow_engine_count', '0', transform=int)
+        self.overflow_queue_depth = self._read_property('coral', 'overflow_queue_depth', '2', transform=int)
+        self.inference_batch_size = self._read_property('coral', 'batch_size', '1', transform=int)
+        self.inference_batch_timeout_ms = self._read_property('coral', 'batch_timeout_ms', '5', transform=float)
+        self.roi_decodes = self._read_map('coral', 'roi_decode', str_to_bool)
+        self.reuse_max_changes = self._read_map('coral', 'reuse_max_change', float)
+
+        self.detection_cache_entries = self._read_property('detection_cache', 'memory_entries', '4096', transform=int)
+        self.detection_cache_dir = self._read_property('detection_cache', 'disk_dir', '')
+        self.detection_cache_disk_mb = self._read_property('detection_cache', 'disk_mb', '256', transform=float)
 
         self.excluded_zone_prefix = self._read_property('detection_filter', 'excluded_zone_prefix')
+        self.nms_iou_threshold = self._read_property('detection_filter', 'nms_iou_threshold', '0.5', transform=float)
+        self.containment_threshold = \
+            self._read_property('detection_filter', 'containment_threshold', '0.9', transform=float)
         self.object_labels = self._read_property('detection_filter', 'object_labels', 'person').split(',')
         self.label_file = self._read_property('detection_filter', 'label_file')
         self.min_accepted_frames = self._read_map('detection_filter', 'min_accepted_frames', int)
@@ -81,8 +110,26 @@ class ConfigProvider(ConfigParser):
         self.subject = self._read_property('mail', 'subject')
         self.message = re.sub(r'\n\|', '\n', self._read_property('mail', 'message'))
 
-        self.frame_processing_threads = self._read_property('threading', 'frame_processing_threads', '2', transform=int)
+        self.http_pool_size = self._read_property('http', 'pool_size', '8', transform=int)
+        self.http_concurrency = self._read_property('http', 'concurrency', '4', transform=int)
+        self.http_connect_timeout = self._read_property('http', 'connect_timeout', '5', transform=float)
+        self.http_read_timeout = self._read_property('http', 'read_timeout', '30', transform=float)
+
+        self.decode_threads = self._read_property('threading', 'decode_threads', '2', transform=int)
+        self.preprocess_threads = self._read_property('threading', 'preprocess_threads', '1', transform=int)
+        self.frame_processing_threads = self._read_property('threading', 'frame_processing_threads', '1',
+                                                            transform=int)
+        self.inference_threads = self._read_property('threading', 'inference_threads',
+                                                     str(self.frame_processing_threads), transform=int)
+        self.stage_queue_size = self._read_property('threading', 'stage_queue_size', '4', transform=int)
         self.thread_watchdog_delay = self._read_property('threading', 'thread_watchdog_delay', '5', transform=int)
+        self.ingestion_engine = self._read_property('threading', 'ingestion_engine', 'thread')
+        self.ingestion_io_threads = self._read_property('threading', 'ingestion_io_threads', '16', transform=int)
+
+        self.buffers_per_size = self._read_property('memory', 'buffers_per_size', '8', transform=int)
+        self.candidate_store_mb = self._read_property('memory', 'candidate_store_mb', '64', transform=float)
+        self.candidate_spill_dir = self._read_property('memory', 'candidate_spill_dir', '')
+        self.max_cached_events = self._read_property('memory', 'max_cached_events', '10000', transform=int)
 
         self.event_ids = [x for x in self._read_property('debug', 'event_ids', '').split(',') if x]
         self.debug_images = [x for x in self._read_property('debug', 'debug_images', '').split(',') if x]
@@ -149,6 +196,10 @@ class ConfigProvider(ConfigParser):
         return self._recognized_config_map.setdefault(section, set())
 
 
+def str_to_bool(string: str) -> bool:
+    return string.strip().lower() in ('1', 'yes', 'true', 'on')
+
+
 def str_to_list(string: str, transform=float) -> Iterable[float]:
     return list(map(transform, string.split(',')))
 
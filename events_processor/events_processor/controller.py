@@ -3,10 +3,12 @@ import time
 
 from injector import inject, ProviderOf
 
+from events_processor.asyncreader import AsyncFrameReaderWorker
+from events_processor.batching import InferenceBatcher
 from events_processor.configtools import ConfigProvider
 from events_processor.interfaces import SystemTime, Engine
 from events_processor.notifications import NotificationWorker
-from events_processor.processor import FrameProcessorWorker
+from events_processor.processor import FrameProcessorWorker, FrameDecodeWorker, FramePreprocessWorker
 from events_processor.reader import FrameReaderWorker
 
 
@@ -17,14 +19,29 @@ class MainController:
     def __init__(self,
                  config: ConfigProvider,
                  engine: Engine,
-                 frame_reader_worker: FrameReaderWorker,
+                 frame_reader_worker_provider: ProviderOf[FrameReaderWorker],
+                 async_frame_reader_worker_provider: ProviderOf[AsyncFrameReaderWorker],
                  notification_worker: NotificationWorker,
+                 frame_decode_worker_provider: ProviderOf[FrameDecodeWorker],
+                 frame_preprocess_worker_provider: ProviderOf[FramePreprocessWorker],
                  frame_processor_worker_provider: ProviderOf[FrameProcessorWorker],
+                 inference_batcher: InferenceBatcher,
                  ):
         self._config = config
         self._engine = engine
+
+        frame_reader_worker: FrameReaderWorker
+        if config.ingestion_engine == 'asyncio':
+            frame_reader_worker = async_frame_reader_worker_provider.get()
+        else:
+            frame_reader_worker = frame_reader_worker_provider.get()
+
         self._threads = [notification_worker, frame_reader_worker]
-        self._threads += [frame_processor_worker_provider.get() for _ in range(config.frame_processing_threads)]
+        self._threads += [frame_decode_worker_provider.get() for _ in range(config.decode_threads)]
+        self._threads += [frame_preprocess_worker_provider.get() for _ in range(config.preprocess_threads)]
+        self._threads += [frame_processor_worker_provider.get() for _ in range(config.inference_threads)]
+        if inference_batcher.enabled:
+            self._threads.append(inference_batcher)
 
     def start(self, watchdog: bool = True) -> None:
         for thread in self._threads:
@@ -51,7 +68,14 @@ class MainController:
             time.sleep(self._config.thread_watchdog_delay)
 
     def _engine_is_stuck(self) -> bool:
-        return self._engine is not None and self._engine.get_pending_processing_seconds() > 60
+        if self._engine is None:
+            return False
+
+        pending_seconds = self._engine.get_pending_processing_seconds_per_instance()
+        stuck_instances = [i for (i, seconds) in enumerate(pending_seconds) if seconds > 60]
+        if stuck_instances:
+            self.log.error(f"Engine instances {stuck_instances} stuck, pending processing seconds: {pending_seconds}")
+        return bool(stuck_instances)
 
     def _any_thread_is_dead(self) -> bool:
         return any(not t.is_alive() for t in self._threads)
@@ -0,0 +1,84 @@
+import time
+from threading import Lock
+from typing import Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from injector import inject
+
+from events_processor.configtools import ConfigProvider
+from events_processor.interfaces import Engine
+
+
+class DetectionCandidate:
+    def __init__(self, bounding_box: Any, score: float, label_id: int):
+        self.bounding_box = bounding_box
+        self.score = score
+        self.label_id = label_id
+
+
+class TFLiteDetectionEngine(Engine):
+    @inject
+    def __init__(self, config: ConfigProvider):
+        self._interpreter = self._create_interpreter(config.cpu_model_file, config.cpu_threads_per_engine)
+        self._interpreter.allocate_tensors()
+        self._input_detail = self._interpreter.get_input_details()[0]
+        self._output_details = self._interpreter.get_output_details()
+
+        self._engine_lock = Lock()
+        self._pending_processing_start = 0
+
+    @staticmethod
+    def _create_interpreter(model_file: str, num_threads: int) -> Any:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        return Interpreter(model_path=model_file, num_threads=num_threads)
+
+    def input_shape(self) -> Optional[Tuple[int, int]]:
+        (_, height, width, _) = self._input_detail['shape']
+        return int(width), int(height)
+
+    def detect(self, img, threshold):
+        image = np.asarray(img)
+        (width, height) = self.input_shape()
+        scale = min(width / image.shape[1], height / image.shape[0])
+        (scaled_w, scaled_h) = (min(int(image.shape[1] * scale), width), min(int(image.shape[0] * scale), height))
+
+        tensor = np.zeros((height, width, 3), np.uint8)
+        tensor[:scaled_h, :scaled_w] = cv2.resize(image, (scaled_w, scaled_h), interpolation=cv2.INTER_AREA)
+
+        candidates = self.detect_tensor(tensor, threshold)
+        for candidate in candidates:
+            candidate.bounding_box = candidate.bounding_box * (width, height) / scale
+        return candidates
+
+    def detect_tensor(self, tensor, threshold):
+        return self.detect_batch([tensor], threshold)[0]
+
+    def detect_batch(self, tensors, threshold):
+        with self._engine_lock:
+            results = []
+            for tensor in tensors:
+                self._pending_processing_start = time.monotonic()
+                self._interpreter.set_tensor(self._input_detail['index'], tensor[np.newaxis])
+                self._interpreter.invoke()
+                results.append(self._read_candidates(threshold))
+            self._pending_processing_start = 0
+            return results
+
+    def _read_candidates(self, threshold: float) -> List[DetectionCandidate]:
+        (boxes, classes, scores, count) = (self._interpreter.get_tensor(detail['index'])[0]
+                                           for detail in self._output_details[:4])
+        candidates = []
+        for i in range(int(count)):
+            if scores[i] >= threshold:
+                (ymin, xmin, ymax, xmax) = np.clip(boxes[i], 0, 1)
+                candidates.append(DetectionCandidate(np.array([[xmin, ymin], [xmax, ymax]]),
+                                                     float(scores[i]), int(classes[i])))
+        return candidates
+
+    def get_pending_processing_seconds(self) -> float:
+        start = self._pending_processing_start
+        return (time.monotonic() - start) if start != 0 else 0
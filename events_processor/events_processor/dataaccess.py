@@ -1,23 +1,45 @@
+import logging
+import time
 from configparser import ConfigParser, ExtendedInterpolation
-from typing import Callable, Any, Dict, Iterable, Optional
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock, BoundedSemaphore
+from typing import Callable, Any, Dict, Iterable, Optional, List, Iterator
 
-import mysql.connector
-from mysql.connector import Error
+from injector import inject
+from mysql.connector import Error, InterfaceError, OperationalError
+from mysql.connector.pooling import MySQLConnectionPool
 
-from events_processor.interfaces import ZoneReader, AlarmBoxReader, MonitorReader
-from events_processor.models import ZoneInfo, Rect, MonitorInfo
+from events_processor.configtools import ConfigProvider
+from events_processor.interfaces import ZoneReader, AlarmBoxReader, MonitorReader, ResourceReader
+from events_processor.models import ZoneInfo, Rect, MonitorInfo, EventInfo, FrameInfo
+from events_processor.reader import FrameReader
 
 _CONN_POOL_DEFAULTS = {'pool_size': 8,
                        'pool_name': "mysql_conn_pool"}
 
+_METRICS_LOG_SECONDS = 300
+
+
+class ConnectionPool:
+    log = logging.getLogger("events_processor.ConnectionPool")
 
-class QuerySupport:
     def __init__(self):
         self._config = ConfigParser(interpolation=ExtendedInterpolation())
         self._config.read('db.ini')
 
-    def _db_config(self, int_keywords: Iterable[str] = ('pool_size',)) -> Dict:
-        db_config = _CONN_POOL_DEFAULTS
+        self._db_config = self._read_db_config()
+        self._pool: Optional[MySQLConnectionPool] = None
+        self._pool_lock = Lock()
+        self._slots = BoundedSemaphore(self._db_config['pool_size'])
+
+        self._metrics_lock = Lock()
+        self._metrics = {'checkouts': 0, 'in_use': 0, 'failures': 0, 'reconnects': 0,
+                         'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        self._metrics_logged = time.monotonic()
+
+    def _read_db_config(self, int_keywords: Iterable[str] = ('pool_size',)) -> Dict:
+        db_config = dict(_CONN_POOL_DEFAULTS)
 
         db_config.update(self._config['db'])
         for kwd in int_keywords:
@@ -25,22 +47,107 @@ class QuerySupport:
                 db_config[kwd] = int(db_config[kwd])
         return db_config
 
-    def invoke_query(self, query_callback: Callable[[Any], Any]):
-        conn = None
+    def _get_pool(self) -> MySQLConnectionPool:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = MySQLConnectionPool(**self._db_config)
+            return self._pool
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        wait_start = time.monotonic()
+        with self._slots:
+            wait_seconds = time.monotonic() - wait_start
+            conn = self._get_pool().get_connection()
+            self._record_checkout(wait_seconds)
+            try:
+                self._ensure_connected(conn)
+                yield conn
+            finally:
+                conn.close()
+                self._record_checkin()
+
+    def _ensure_connected(self, conn) -> None:
         try:
-            conn = mysql.connector.connect(**self._db_config())
+            conn.ping(reconnect=False)
+        except Error:
+            self._update_metrics(reconnects=1)
+            conn.reconnect(attempts=2, delay=1)
+
+    def record_failure(self) -> None:
+        self._update_metrics(failures=1)
+
+    def metrics(self) -> Dict[str, float]:
+        with self._metrics_lock:
+            return dict(self._metrics)
+
+    def _record_checkout(self, wait_seconds: float) -> None:
+        with self._metrics_lock:
+            self._metrics['max_wait_seconds'] = max(self._metrics['max_wait_seconds'], wait_seconds)
+        self._update_metrics(checkouts=1, in_use=1, wait_seconds=wait_seconds)
+
+    def _record_checkin(self) -> None:
+        self._update_metrics(in_use=-1)
+
+        now = time.monotonic()
+        if now - self._metrics_logged >= _METRICS_LOG_SECONDS:
+            self._metrics_logged = now
+            self.log.info(f"Connection pool metrics: {self.metrics()}")
+
+    def _update_metrics(self, **deltas: float) -> None:
+        with self._metrics_lock:
+            for (key, delta) in deltas.items():
+                self._metrics[key] += delta
+
+
+class QuerySupport:
+    log = logging.getLogger("events_processor.QuerySupport")
+
+    @inject
+    def __init__(self, connection_pool: ConnectionPool):
+        self._connection_pool = connection_pool
+
+    def invoke_query(self, query_callback: Callable[[Any], Any], attempts: int = 2):
+        for attempt in range(1, attempts + 1):
+            try:
+                with self._connection_pool.connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        return query_callback(cursor)
+                    finally:
+                        cursor.close()
+            except (InterfaceError, OperationalError) as e:
+                self._connection_pool.record_failure()
+                self.log.warning(f"Database connection error (attempt {attempt}/{attempts}): {e}")
+                if attempt == attempts:
+                    raise
+            except Error as e:
+                self._connection_pool.record_failure()
+                self.log.error(f"Error when executing query: {e}")
+                break
+        return None
+
+    @staticmethod
+    def fetch_json_rows(cursor) -> List[Dict]:
+        columns = [c[0] for c in cursor.description]
+        return [{column: _to_json_value(value) for (column, value) in zip(columns, row)}
+                for row in cursor.fetchall()]
 
-            if conn.is_connected():
-                cursor = conn.cursor()
-                return query_callback(cursor)
-        except Error as e:
-            print("Error when executing query", e)
-        finally:
-            conn.close()
+
+def _to_json_value(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+
+def _in_placeholders(values: Iterable[Any]) -> str:
+    return ', '.join('%s' for _ in values)
 
 
 class DBAlarmBoxReader(AlarmBoxReader, QuerySupport):
-    def read(self, event_id: str, frame_id: str, excl_zone_prefix) -> Optional[Rect]:
+    def read(self, event_id: str, frame_id: str, excl_zone_prefix) -> List[Rect]:
         def query(cursor):
             cursor.execute(
                 """select st.MinX, st.MinY, st.MaxX, st.MaxY 
@@ -51,10 +158,31 @@ class DBAlarmBoxReader(AlarmBoxReader, QuerySupport):
                 {'eventId': event_id,
                  'frameId': frame_id,
                  'prefix': excl_zone_prefix})
-            return cursor.fetchone()
+            return cursor.fetchall()
+
+        return [Rect(*box) for box in self.invoke_query(query) or ()]
+
+    def read_many(self, event_id: str, frame_ids: Iterable[str], excl_zone_prefix) -> Dict[str, List[Rect]]:
+        frame_ids = list(frame_ids)
+
+        def query(cursor):
+            cursor.execute(
+                f"""select st.FrameId, st.MinX, st.MinY, st.MaxX, st.MaxY
+                      from Stats st
+                      join Zones zn    on st.ZoneId = zn.Id
+                     where st.eventId = %s and st.frameId in ({_in_placeholders(frame_ids)})
+                       and zn.Name not like concat(%s, '%')""",
+                [event_id, *frame_ids, excl_zone_prefix])
+            return cursor.fetchall()
 
         res = self.invoke_query(query)
-        return Rect(*res) if res else None
+        if res is None:
+            return {}
+
+        boxes: Dict[str, List[Rect]] = {frame_id: [] for frame_id in frame_ids}
+        for (frame_id, *box) in res:
+            boxes.setdefault(str(frame_id), []).append(Rect(*box))
+        return boxes
 
 
 class DBZoneReader(ZoneReader, QuerySupport):
@@ -69,7 +197,7 @@ class DBZoneReader(ZoneReader, QuerySupport):
             return cursor.fetchall()
 
         return [ZoneInfo(str(m_id), int(w), int(h), name, coords) for (m_id, w, h, name, coords) in
-                self.invoke_query(query)]
+                self.invoke_query(query) or ()]
 
 
 class DBMonitorReader(MonitorReader, QuerySupport):
@@ -80,4 +208,123 @@ class DBMonitorReader(MonitorReader, QuerySupport):
                    from Monitors m """)
             return cursor.fetchall()
 
-        return [MonitorInfo(str(id), name) for (id, name) in self.invoke_query(query)]
+        return [MonitorInfo(str(id), name) for (id, name) in self.invoke_query(query) or ()]
+
+
+class DBFrameReader(FrameReader, QuerySupport):
+    log = logging.getLogger("events_processor.DBFrameReader")
+    _EVENT_COLUMNS = """e.Id, e.MonitorId, e.Name, e.StartTime, e.EndTime, e.Width, e.Height, e.Length,
+                        e.Frames, e.AlarmFrames, e.TotScore, e.AvgScore, e.MaxScore, e.Emailed"""
+
+    @inject
+    def __init__(self,
+                 resource_reader: ResourceReader,
+                 config: ConfigProvider,
+                 connection_pool: ConnectionPool):
+        FrameReader.__init__(self, resource_reader, config)
+        QuerySupport.__init__(self, connection_pool)
+
+    def events_iter(self, from_event_id: Optional[int] = None) -> Iterable[Dict]:
+        def query(cursor):
+            if from_event_id is None:
+                cursor.execute(
+                    f"""select {self._EVENT_COLUMNS}
+                          from Events e
+                         where e.StartTime > now() - interval %(window)s second
+                         order by e.Id""",
+                    {'window': self._config.events_window_seconds})
+            else:
+                cursor.execute(
+                    f"""select {self._EVENT_COLUMNS}
+                          from Events e
+                         where e.Id >= %(eventId)s
+                         order by e.Id""",
+                    {'eventId': from_event_id})
+            return self.fetch_json_rows(cursor)
+
+        return self.invoke_query(query) or ()
+
+    def events_by_id_iter(self, event_ids: Iterable[str]) -> Iterable[Dict]:
+        event_ids = list(event_ids)
+
+        def query(cursor):
+            cursor.execute(
+                f"""select {self._EVENT_COLUMNS}
+                      from Events e
+                     where e.Id in ({_in_placeholders(event_ids)})
+                     order by e.Id""",
+                event_ids)
+            return self.fetch_json_rows(cursor)
+
+        return (self.invoke_query(query) or ()) if event_ids else ()
+
+    def frames_many(self, event_infos: Iterable[EventInfo]) -> List[Optional[List[FrameInfo]]]:
+        event_infos = list(event_infos)
+        if not event_infos:
+            return []
+
+        frame_ranges = [(e.event_id, e.last_frame_id) for e in event_infos]
+        ranges_params = [param for frame_range in frame_ranges for param in frame_range]
+
+        def ranges_condition(alias):
+            return ' or '.join(f'({alias}.EventId = %s and {alias}.FrameId > %s)' for _ in frame_ranges)
+
+        monitor_ids = list({e.monitor_id for e in event_infos})
+
+        def query(cursor):
+            cursor.execute(
+                f"""select f.Id, f.EventId, f.FrameId, f.Type, f.TimeStamp, f.Delta, f.Score
+                      from Frames f
+                     where f.Type = 'Alarm' and ({ranges_condition('f')})
+                     order by f.EventId, f.FrameId""",
+                ranges_params)
+            frame_rows = self.fetch_json_rows(cursor)
+
+            cursor.execute(
+                f"""select st.EventId, st.FrameId, st.MinX, st.MinY, st.MaxX, st.MaxY
+                      from Stats st
+                      join Zones zn    on st.ZoneId = zn.Id
+                     where ({ranges_condition('st')})
+                       and zn.Name not like concat(%s, '%')""",
+                ranges_params + [self._config.excluded_zone_prefix])
+            stats_rows = cursor.fetchall()
+
+            cursor.execute(
+                f"""select m.*
+                      from Monitors m
+                     where m.Id in ({_in_placeholders(monitor_ids)})""",
+                monitor_ids)
+            monitor_rows = self.fetch_json_rows(cursor)
+
+            return frame_rows, stats_rows, monitor_rows
+
+        result = self.invoke_query(query)
+        if not result:
+            return [None for _ in event_infos]
+
+        (frame_rows, stats_rows, monitor_rows) = result
+        monitors = {m['Id']: m for m in monitor_rows}
+
+        alarm_boxes: Dict[str, Dict[str, List[Rect]]] = {}
+        for (event_id, frame_id, *box) in stats_rows:
+            alarm_boxes.setdefault(str(event_id), {}).setdefault(str(frame_id), []).append(Rect(*box))
+
+        frames_json: Dict[str, List[Dict]] = {}
+        for frame_json in frame_rows:
+            frames_json.setdefault(frame_json['EventId'], []).append(frame_json)
+
+        frames: List[Optional[List[FrameInfo]]] = []
+        for event_info in event_infos:
+            monitor_json = monitors.get(event_info.monitor_id)
+            if monitor_json is None:
+                self.log.warning(f"Monitor {event_info.monitor_id} of event {event_info.event_id} not found, "
+                                 f"skipping event")
+                frames.append(None)
+                continue
+
+            with event_info.lock:
+                event_info.alarm_boxes.update(alarm_boxes.get(event_info.event_id, {}))
+
+            details = (event_info.event_json, frames_json.get(event_info.event_id, []), monitor_json)
+            frames.append(self._create_frames(event_info, details))
+        return frames
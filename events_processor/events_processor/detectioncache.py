@@ -0,0 +1,216 @@
+import logging
+import os
+import tempfile
+import time
+from hashlib import blake2b
+from threading import Lock
+from typing import Any, List, NewType, Optional, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+from injector import inject
+
+from events_processor.configtools import ConfigProvider
+from events_processor.cpuengine import DetectionCandidate
+from events_processor.interfaces import Engine
+
+CachedEngine = NewType('CachedEngine', Engine)
+
+_STATS_LOG_SECONDS = 300
+
+
+class CachingDetectionEngine(Engine):
+    log = logging.getLogger("events_processor.CachingDetectionEngine")
+
+    @inject
+    def __init__(self, config: ConfigProvider, engine: CachedEngine):
+        self._config = config
+        self._engine = engine
+        self._lock = Lock()
+        self._memory_cache: LRUCache[str, List[DetectionCandidate]] = \
+            LRUCache(maxsize=max(config.detection_cache_entries, 1))
+        self._model_key = self._read_model_key()
+        self._disk_bytes: Optional[int] = None
+        self._stats_logged = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def detect(self, img, threshold):
+        key = self._key(np.asarray(img), threshold, 'image')
+        result = self._lookup(key)
+        if result is None:
+            result = self._engine.detect(img, threshold)
+            self._store(key, result)
+        return self._copied(result)
+
+    def input_shape(self) -> Optional[Tuple[int, int]]:
+        return self._engine.input_shape()
+
+    def detect_tensor(self, tensor, threshold):
+        return self.detect_batch([tensor], threshold)[0]
+
+    def detect_batch(self, tensors, threshold):
+        keys = [self._key(tensor, threshold, 'tensor') for tensor in tensors]
+        results = [self._lookup(key) for key in keys]
+
+        missing = [i for (i, result) in enumerate(results) if result is None]
+        if missing:
+            detected = self._engine.detect_batch([tensors[i] for i in missing], threshold)
+            for (i, result) in zip(missing, detected):
+                self._store(keys[i], result)
+                results[i] = result
+
+        return [self._copied(result) for result in results]
+
+    def get_pending_processing_seconds(self) -> float:
+        return self._engine.get_pending_processing_seconds()
+
+    def get_pending_processing_seconds_per_instance(self) -> List[float]:
+        return self._engine.get_pending_processing_seconds_per_instance()
+
+    @property
+    def enabled(self) -> bool:
+        return self._config.detection_cache_entries > 0 or bool(self._config.detection_cache_dir)
+
+    def _read_model_key(self) -> str:
+        model_file = self._config.cpu_model_file if self._config.engine_backend == 'cpu' \
+            else self._config.detector_model_file
+        try:
+            stat = os.stat(model_file)
+            return f"{model_file}:{stat.st_size}:{stat.st_mtime_ns}"
+        except (OSError, TypeError):
+            return str(model_file)
+
+    def _key(self, pixels: Any, threshold: float, kind: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        pixels = np.ascontiguousarray(pixels)
+        digest = blake2b(digest_size=20)
+        digest.update(f"{self._model_key}|{threshold:.4f}|{kind}|{pixels.shape}|{pixels.dtype}".encode())
+        digest.update(memoryview(pixels).cast('B'))
+        return digest.hexdigest()
+
+    def _lookup(self, key: Optional[str]) -> Optional[List[DetectionCandidate]]:
+        if key is None:
+            return None
+
+        with self._lock:
+            result = self._memory_cache.get(key)
+        if result is None:
+            result = self._read_from_disk(key)
+            if result is not None and self._config.detection_cache_entries > 0:
+                with self._lock:
+                    self._memory_cache[key] = result
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self._log_stats()
+        return result
+
+    def _log_stats(self) -> None:
+        now = time.monotonic()
+        if now - self._stats_logged >= _STATS_LOG_SECONDS:
+            self._stats_logged = now
+            self.log.debug(f"Detection cache hits: {self.hits}, misses: {self.misses}, "
+                           f"disk bytes: {self._disk_bytes}")
+
+    def _store(self, key: Optional[str], result: Any) -> None:
+        if key is None or result is None:
+            return
+
+        candidates = self._copied(result)
+        if self._config.detection_cache_entries > 0:
+            with self._lock:
+                self._memory_cache[key] = candidates
+        self._write_to_disk(key, candidates)
+
+    def _read_from_disk(self, key: str) -> Optional[List[DetectionCandidate]]:
+        if not self._config.detection_cache_dir:
+            return None
+
+        path = self._disk_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                result = [DetectionCandidate(box, float(score), int(label_id))
+                          for (box, score, label_id) in zip(data['boxes'], data['scores'], data['labels'])]
+            os.utime(path)
+            return result
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            self.log.warning(f"Could not read cached detections {path}: {e}")
+            return None
+
+    def _write_to_disk(self, key: str, candidates: List[DetectionCandidate]) -> None:
+        if not self._config.detection_cache_dir:
+            return
+
+        path = self._disk_path(key)
+        temp_path = None
+        try:
+            os.makedirs(self._config.detection_cache_dir, exist_ok=True)
+            (fd, temp_path) = tempfile.mkstemp(dir=self._config.detection_cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f,
+                         boxes=np.array([c.bounding_box for c in candidates], dtype=float).reshape((-1, 2, 2)),
+                         scores=np.array([c.score for c in candidates], dtype=float),
+                         labels=np.array([c.label_id for c in candidates], dtype=int))
+            written = os.path.getsize(temp_path)
+            with self._lock:
+                replaced = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(temp_path, path)
+            temp_path = None
+            self._account_disk_bytes(written - replaced)
+        except OSError as e:
+            self.log.warning(f"Could not write cached detections {path}: {e}")
+        finally:
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def _account_disk_bytes(self, added: int) -> None:
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for (_, _, size) in self._disk_entries())
+            else:
+                self._disk_bytes += added
+            if self._disk_bytes > self._config.detection_cache_disk_mb * 1024 * 1024:
+                self._evict_from_disk()
+
+    def _evict_from_disk(self) -> None:
+        budget = self._config.detection_cache_disk_mb * 1024 * 1024 * 0.9
+        entries = sorted(self._disk_entries())
+        self._disk_bytes = sum(size for (_, _, size) in entries)
+        for (_, path, size) in entries:
+            if self._disk_bytes <= budget:
+                break
+            try:
+                os.remove(path)
+                self._disk_bytes -= size
+            except OSError:
+                pass
+
+    def _disk_entries(self) -> List[Tuple[float, str, int]]:
+        entries = []
+        with os.scandir(self._config.detection_cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.npz'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self._config.detection_cache_dir, f"{key}.npz")
+
+    @staticmethod
+    def _copied(result: Any) -> Any:
+        if result is None:
+            return None
+        return [DetectionCandidate(np.array(c.bounding_box, dtype=float), float(c.score), int(c.label_id))
+                for c in result]
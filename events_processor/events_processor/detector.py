@@ -1,19 +1,51 @@
 import logging
 import math
+import threading
 import time
 from threading import Lock
-from typing import Any
+from typing import Any, List, NamedTuple, Optional, Tuple
 
+import cv2
+import numpy as np
 from PIL import Image
 from PIL.ImageDraw import Draw
 from injector import inject
 
+from events_processor.batching import InferenceBatcher
 from events_processor.configtools import get_config, ConfigProvider
 from events_processor.interfaces import Detector, Engine, AlarmBoxReader
 from events_processor.models import FrameInfo, Rect, Detection
 from events_processor.preprocessor import RotatingPreprocessor
 from events_processor.renderer import DetectionRenderer
-from events_processor.shapeutils import bounding_box
+from events_processor.shapeutils import bounding_box, union_rect, rects_intersect
+
+CHUNK_SIZE = 300
+DECODE_REDUCTIONS = (8, 4, 2)
+MAX_ROI_FRAME_FRACTION = 0.6
+SIGNATURE_CELL_SIZE = 8
+MAX_GRID_CHUNKS = 8
+
+
+class ImageSize(NamedTuple):
+    width: int
+    height: int
+    scale: int = 1
+
+
+class ChunkPlan(NamedTuple):
+    x_chunks: int
+    y_chunks: int
+    overlap: int = 0
+    overview: bool = False
+
+    @property
+    def inferences(self) -> int:
+        return self.x_chunks * self.y_chunks + int(self.overview)
+
+
+class FrameSignature(NamedTuple):
+    rect: Rect
+    thumbnail: Any
 
 
 class SynchronizedDetectionEngine(Engine):
@@ -34,6 +66,22 @@ class SynchronizedDetectionEngine(Engine):
             self._pending_processing_start = 0
             return result
 
+    def input_shape(self) -> Optional[Tuple[int, int]]:
+        (_, height, width, _) = self._engine.get_input_tensor_shape()
+        return width, height
+
+    def detect_tensor(self, tensor, threshold):
+        return self.detect_batch([tensor], threshold)[0]
+
+    def detect_batch(self, tensors, threshold):
+        with self._engine_lock:
+            results = []
+            for tensor in tensors:
+                self._pending_processing_start = time.monotonic()
+                results.append(self._engine.DetectWithInputTensor(tensor.reshape(-1), threshold=threshold, top_k=1000))
+            self._pending_processing_start = 0
+            return results
+
     def get_pending_processing_seconds(self) -> float:
         start = self._pending_processing_start
         return (time.monotonic() - start) if start != 0 else 0
@@ -48,58 +96,238 @@ class CoralDetector(Detector):
                  engine: Engine,
                  alarm_box_reader: AlarmBoxReader,
                  preprocessor: RotatingPreprocessor,
-                 detection_renderer: DetectionRenderer):
+                 detection_renderer: DetectionRenderer,
+                 inference_batcher: InferenceBatcher):
         self._config = config
         self._engine = engine
+        self._inference_batcher = inference_batcher
         self._alarm_box_reader = alarm_box_reader
         self._preprocessor = preprocessor
         self._detection_renderer = detection_renderer
+        input_shape = engine.input_shape()
+        self._tensor_input = input_shape is not None
+        self._input_shape: Tuple[int, int] = input_shape or (CHUNK_SIZE, CHUNK_SIZE)
+        self._chunk_size = ImageSize(*self._input_shape)
+        self._thread_local = threading.local()
+
+    def decode_reduction(self, frame_info: FrameInfo) -> int:
+        event_info = frame_info.event_info
+        reduction = get_config(self._config.decode_reductions, event_info.monitor_id, '1')
+        if reduction != 'auto':
+            return int(reduction)
+
+        (x_chunks, y_chunks) = get_config(self._config.detection_chunks, event_info.monitor_id, (1, 1))
+        chunk_size = min(event_info.width / x_chunks, event_info.height / y_chunks)
+        min_chunk_size = min(self._chunk_size.width, self._chunk_size.height)
+        return next((r for r in DECODE_REDUCTIONS if chunk_size / r >= min_chunk_size), 1)
+
+    def decode_roi(self, frame_info: FrameInfo, reduction: int) -> Optional[Rect]:
+        event_info = frame_info.event_info
+        monitor_id = event_info.monitor_id
+        if not get_config(self._config.roi_decodes, monitor_id, False):
+            return None
+        if self._config.rotations.get(monitor_id, 0) != 0:
+            return None
+
+        alarm_boxes = self._read_alarm_boxes(frame_info)
+        if not alarm_boxes:
+            return None
+
+        size = ImageSize(event_info.width // reduction, event_info.height // reduction, reduction)
+        chunk_rects = self._plan_chunk_rects([box.scaled(1 / reduction) for box in alarm_boxes], size, monitor_id)
+        roi = union_rect(*chunk_rects).scaled(reduction)
+
+        if roi.area > MAX_ROI_FRAME_FRACTION * event_info.width * event_info.height:
+            return None
+        return roi
 
     def detect(self, frame_info: FrameInfo) -> None:
         monitor_id = frame_info.event_info.monitor_id
-        img = Image.fromarray(frame_info.image)
+        size = ImageSize(*self._preprocessor.image_size(frame_info), frame_info.image_scale)
+
+        regions = self._calculate_detection_regions(frame_info, size)
+
+        chunk_rects = self._plan_chunk_rects(regions, size, monitor_id)
+        frame_info.chunk_rects = [frame_info.from_image_rect(r) for r in chunk_rects]
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(f"Planned {len(chunk_rects)} inferences for {frame_info}, "
+                           f"full frame plan: {self.expected_inferences(frame_info)}")
 
-        box = self._calculate_detection_box(frame_info, img)
+        signature = self._frame_signature(frame_info, chunk_rects)
+        result = self._reused_detections(frame_info, signature)
+        if result is None:
+            if not self._tensor_input:
+                result = [detection for rect in chunk_rects for detection in self.detect_in_rect(frame_info, rect)]
+            else:
+                result = self._detect_in_rects_batched(frame_info, chunk_rects)
 
-        frame_info.chunk_rects = self._calculate_chunk_rects(box, img, monitor_id)
+            for detection in result:
+                detection.rect = frame_info.from_image_rect(detection.rect)
 
-        result = []
-        for rect in frame_info.chunk_rects:
-            detections = self.detect_in_rect(img, rect)
-            result += detections
+            if signature is not None:
+                with frame_info.event_info.lock:
+                    frame_info.event_info.inference_reference = (signature, result)
 
-        self._debug_draw(frame_info, img)
+        self._debug_draw(frame_info)
 
         frame_info.detections = result
 
-    def _calculate_detection_box(self, frame_info: FrameInfo, img):
-        event_id = frame_info.event_id
+    def _frame_signature(self, frame_info: FrameInfo, chunk_rects: List[Rect]) -> Optional[FrameSignature]:
+        if get_config(self._config.reuse_max_changes, frame_info.event_info.monitor_id, 0) <= 0:
+            return None
+
+        image_rect = union_rect(*chunk_rects)
+        rect = frame_info.from_image_rect(image_rect)
+        size = (max(rect.width // SIGNATURE_CELL_SIZE, 1), max(rect.height // SIGNATURE_CELL_SIZE, 1))
+
+        region = self._preprocessor.extract_region(frame_info, image_rect)
+        gray = cv2.cvtColor(region, cv2.COLOR_RGB2GRAY) if region.ndim == 3 else region
+        thumbnail = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+        self._preprocessor.release_region(region)
+
+        return FrameSignature(rect, thumbnail)
+
+    def _reused_detections(self, frame_info: FrameInfo, signature: Optional[FrameSignature]) -> Optional[List]:
+        if signature is None:
+            return None
+
+        event_info = frame_info.event_info
+        with event_info.lock:
+            reference = event_info.inference_reference
+        if reference is None:
+            return None
+
+        (reference_signature, reference_detections) = reference
+        change = self._signature_change(reference_signature, signature)
+        if change is None or change > get_config(self._config.reuse_max_changes, event_info.monitor_id, 0):
+            return None
+
+        self.log.debug(f"Reusing detections for {frame_info}, change: {change:.4f}")
+        return [Detection(d.rect, d.score, d.label_id) for d in reference_detections]
+
+    @staticmethod
+    def _signature_change(reference: FrameSignature, signature: FrameSignature) -> Optional[float]:
+        (ref, rect) = (reference.rect, signature.rect)
+        if rect.left < ref.left or rect.top < ref.top or rect.right > ref.right or rect.bottom > ref.bottom:
+            return None
+
+        x = (rect.left - ref.left) // SIGNATURE_CELL_SIZE
+        y = (rect.top - ref.top) // SIGNATURE_CELL_SIZE
+        (h, w) = signature.thumbnail.shape[:2]
+        reference_thumbnail = reference.thumbnail[y:y + h, x:x + w]
+        if reference_thumbnail.shape != signature.thumbnail.shape:
+            return None
+
+        return float(np.mean(cv2.absdiff(reference_thumbnail, signature.thumbnail))) / 255
+
+    def expected_inferences(self, frame_info: FrameInfo) -> int:
+        event_info = frame_info.event_info
+        size = ImageSize(*self._preprocessor.image_size(frame_info), frame_info.image_scale)
+        region = Rect(0, 0, size.width - 1, size.height - 1)
+        return self._chunk_plan(region, size, event_info.monitor_id).inferences
+
+    def _plan_chunk_rects(self, regions: List[Rect], img, monitor_id) -> List[Rect]:
+        return [chunk_rect
+                for region in self._merge_overlapping_regions(regions, img, monitor_id)
+                for chunk_rect in self._calculate_chunk_rects(region, img, monitor_id)]
+
+    def _calculate_detection_regions(self, frame_info: FrameInfo, img) -> List[Rect]:
+        frame_info.alarm_boxes = [bounding_box(self._preprocessor.transform_frame_points(frame_info, box.points))
+                                  for box in self._read_alarm_boxes(frame_info)]
+        regions = [self._clipped(frame_info.to_image_rect(box), img) for box in frame_info.alarm_boxes]
+        return [r for r in regions if r.right >= r.left and r.bottom >= r.top] or [Rect(0, 0, img.width, img.height)]
+
+    @staticmethod
+    def _clipped(rect: Rect, img) -> Rect:
+        return Rect(max(rect.left, 0), max(rect.top, 0),
+                    min(rect.right, img.width - 1), min(rect.bottom, img.height - 1))
+
+    def _read_alarm_boxes(self, frame_info: FrameInfo) -> List[Rect]:
+        event_info = frame_info.event_info
         frame_id = frame_info.frame_id
 
-        alarm_box = self._alarm_box_reader.read(event_id, frame_id, self._config.excluded_zone_prefix)
-        if alarm_box:
-            box = bounding_box(self._preprocessor.transform_frame_points(frame_info, alarm_box.points))
-            frame_info.alarm_box = box
-        else:
-            box = Rect(0, 0, img.width, img.height)
-        return box
+        with event_info.lock:
+            if frame_id in event_info.alarm_boxes:
+                return event_info.alarm_boxes[frame_id]
+
+        alarm_boxes = self._alarm_box_reader.read(frame_info.event_id, frame_id, self._config.excluded_zone_prefix)
+        with event_info.lock:
+            event_info.alarm_boxes[frame_id] = alarm_boxes
+        return alarm_boxes
+
+    def _merge_overlapping_regions(self, regions: List[Rect], img, monitor_id) -> List[Rect]:
+        merged = list(regions)
+        i = 0
+        while i < len(merged):
+            extent = self._region_extent(merged[i], img, monitor_id)
+            for j in range(len(merged)):
+                if j != i and rects_intersect(extent, self._region_extent(merged[j], img, monitor_id)):
+                    merged[min(i, j)] = union_rect(merged[i], merged[j])
+                    merged.pop(max(i, j))
+                    i = 0
+                    break
+            else:
+                i += 1
+        return merged
+
+    def _region_extent(self, box: Rect, img, monitor_id) -> Rect:
+        plan = self._chunk_plan(box, img, monitor_id)
+        return self._rect_expanded_to_box(box, *self._grid_size(plan), img.width, img.height)
+
+    def _grid_size(self, plan: ChunkPlan) -> Tuple[int, int]:
+        return (self._chunk_size.width * plan.x_chunks - plan.overlap * (plan.x_chunks - 1),
+                self._chunk_size.height * plan.y_chunks - plan.overlap * (plan.y_chunks - 1))
 
     def _calculate_chunk_rects(self, box: Rect, img, monitor_id):
-        x_chunks, y_chunks = self._calculate_optimal_chunks_number(box, monitor_id)
-        box = self._rect_expanded_to_box(box, 300 * x_chunks, 300 * y_chunks, img.width, img.height)
-        chunk_rects = self._chunk_rects(box, x_chunks, y_chunks)
+        plan = self._chunk_plan(box, img, monitor_id)
+        box = self._region_extent(box, img, monitor_id)
+        chunk_rects = self._chunk_rects(box, plan.x_chunks, plan.y_chunks, plan.overlap)
 
-        if x_chunks != 1 or y_chunks != 1:
-            box = self._rect_expanded_to_box(box, 300, 300, img.width, img.height)
+        if plan.overview:
+            box = self._rect_expanded_to_box(box, self._chunk_size.width, self._chunk_size.height,
+                                             img.width, img.height)
             chunk_rects.append(box)
 
         return chunk_rects
 
-    def _calculate_optimal_chunks_number(self, box: Rect, monitor_id):
+    def _chunk_plan(self, box: Rect, img, monitor_id) -> ChunkPlan:
+        min_object_size = get_config(self._config.min_object_sizes, monitor_id, 0)
+        if monitor_id in self._config.detection_chunks or min_object_size <= 0:
+            return self._configured_chunk_plan(box, monitor_id)
+        return self._cost_chunk_plan(box, min_object_size / img.scale,
+                                     get_config(self._config.max_object_sizes, monitor_id, 0) / img.scale)
+
+    def _configured_chunk_plan(self, box: Rect, monitor_id) -> ChunkPlan:
         configured_chunks = get_config(self._config.detection_chunks, monitor_id, (1, 1))
-        x_chunks = max(min(configured_chunks[0], math.ceil(box.width / 300)), 1)
-        y_chunks = max(min(configured_chunks[1], math.ceil(box.height / 300)), 1)
-        return x_chunks, y_chunks
+        x_chunks = max(min(configured_chunks[0], math.ceil(box.width / self._chunk_size.width)), 1)
+        y_chunks = max(min(configured_chunks[1], math.ceil(box.height / self._chunk_size.height)), 1)
+        return ChunkPlan(x_chunks, y_chunks, overview=(x_chunks, y_chunks) != (1, 1))
+
+    def _cost_chunk_plan(self, box: Rect, min_object_size: float, max_object_size: float) -> ChunkPlan:
+        max_downscale = min_object_size / self._config.min_object_input_pixels
+        overlap = int(min_object_size)
+        (x_chunks, x_overlap) = self._axis_chunks(box.width, self._chunk_size.width * max_downscale, overlap)
+        (y_chunks, y_overlap) = self._axis_chunks(box.height, self._chunk_size.height * max_downscale, overlap)
+        if (x_chunks, y_chunks) == (1, 1):
+            return ChunkPlan(1, 1)
+
+        overlap = min(x_overlap, y_overlap)
+        chunk_length = min(self._axis_chunk_length(box.width, x_chunks, overlap),
+                           self._axis_chunk_length(box.height, y_chunks, overlap))
+        overview = max_object_size <= 0 or max_object_size > chunk_length
+        return ChunkPlan(x_chunks, y_chunks, overlap, overview)
+
+    @staticmethod
+    def _axis_chunk_length(length: int, chunks: int, overlap: int) -> float:
+        return (length + overlap * (chunks - 1)) / chunks
+
+    @staticmethod
+    def _axis_chunks(length: int, max_chunk_length: float, overlap: int) -> Tuple[int, int]:
+        if length <= max_chunk_length:
+            return 1, overlap
+        overlap = min(overlap, int(max_chunk_length / 2))
+        chunks = math.ceil((length - overlap) / (max_chunk_length - overlap))
+        return min(max(chunks, 1), MAX_GRID_CHUNKS), overlap
 
     def _rect_expanded_to_box(self, rect: Rect, ideal_box_w, ideal_box_h, clip_w, clip_h):
         r = Rect(*map(int, rect.box_tuple))
@@ -109,44 +337,96 @@ class CoralDetector(Detector):
 
         return self._calculate_expanded_box(mid_x, mid_y, box_h, box_w, clip_h, clip_w)
 
-    def _debug_draw(self, frame_info: FrameInfo, img):
+    def _debug_draw(self, frame_info: FrameInfo):
         if self._config.debug_images:
+            if frame_info.pending_rotation != 0:
+                self._preprocessor.preprocess(frame_info, full_image=True)
+            img = Image.fromarray(frame_info.image)
             dw = Draw(img)
 
             def rect_drawer(box, color):
+                box = frame_info.to_image_rect(box)
                 dw.line([pt.tuple for pt in (box.points * 2)[:5]], fill=color, width=4)
 
             self._detection_renderer.draw_boxes(frame_info, rect_drawer)
 
             img.save(f"debug_{frame_info.event_id}_{frame_info.frame_id}.jpg")
 
-    def _chunk_rects(self, box: Rect, x_chunks, y_chunks):
+    def _chunk_rects(self, box: Rect, x_chunks, y_chunks, overlap=0):
         rects = []
-        chunk_width = box.width // x_chunks
-        chunk_height = box.height // y_chunks
+        chunk_width = (box.width + overlap * (x_chunks - 1)) // x_chunks
+        chunk_height = (box.height + overlap * (y_chunks - 1)) // y_chunks
         for y in range(y_chunks):
             for x in range(x_chunks):
-                left = math.ceil(chunk_width * x)
-                right = math.ceil(chunk_width * (x + 1)) - 1
-                top = math.ceil(chunk_height * y)
-                bottom = math.ceil(chunk_height * (y + 1)) - 1
+                left = (chunk_width - overlap) * x
+                right = left + chunk_width - 1
+                top = (chunk_height - overlap) * y
+                bottom = top + chunk_height - 1
                 rect = Rect(left, top, right, bottom).moved_by(*box.top_left.tuple)
                 rects.append(rect)
         return rects
 
-    def detect_in_rect(self, img: Any, rect: Rect):
-        cropped_img = img.crop(rect.box_tuple)
+    def detect_in_rect(self, frame_info: FrameInfo, rect: Rect):
+        region = self._preprocessor.extract_region(frame_info, rect)
+        result = self._engine.detect(Image.fromarray(region), self._config.min_score)
+        self._preprocessor.release_region(region)
+
+        return self._to_detections(result, [d.bounding_box.flatten() for d in result], rect)
 
-        result = self._engine.detect(cropped_img, self._config.min_score)
+    def _detect_in_rects_batched(self, frame_info: FrameInfo, rects: List[Rect]) -> List[Detection]:
+        tensors = []
+        scales = []
+        for (index, rect) in enumerate(rects):
+            region = self._preprocessor.extract_region(frame_info, rect)
+            (tensor, scale) = self._fill_input_tensor(region, index)
+            self._preprocessor.release_region(region)
+            tensors.append(tensor)
+            scales.append(scale)
 
+        results = self._inference_batcher.detect_batch(tensors, self._config.min_score)
+
+        tensor_size = np.array(self._input_shape * 2)
+        detections = []
+        for (rect, scale, result) in zip(rects, scales, results):
+            boxes = [detection.bounding_box.flatten() * tensor_size / scale for detection in result]
+            detections += self._to_detections(result, boxes, rect)
+        return detections
+
+    @staticmethod
+    def _to_detections(result, boxes, rect: Rect) -> List[Detection]:
         detections = []
-        for detection in result:
-            r = Rect(*map(int, detection.bounding_box.flatten().tolist()))
+        for (detection, box) in zip(result, boxes):
+            r = Rect(*map(int, box.tolist()))
             d = Detection(r.moved_by(rect.left, rect.top), detection.score, detection.label_id)
             detections.append(d)
 
         return detections
 
+    def _input_tensor(self, index: int) -> np.ndarray:
+        (width, height) = self._input_shape
+        tensors = getattr(self._thread_local, 'input_tensors', None)
+        if tensors is None:
+            tensors = self._thread_local.input_tensors = []
+        while len(tensors) <= index:
+            tensors.append(np.zeros((height, width, 3), np.uint8))
+        return tensors[index]
+
+    def _fill_input_tensor(self, region, index: int = 0) -> Tuple[np.ndarray, float]:
+        (width, height) = self._input_shape
+        tensor = self._input_tensor(index)
+
+        (region_h, region_w) = region.shape[:2]
+        scale = min(width / region_w, height / region_h)
+        (scaled_w, scaled_h) = (min(int(region_w * scale), width), min(int(region_h * scale), height))
+
+        if (scaled_w, scaled_h) == (width, height):
+            cv2.resize(region, (width, height), dst=tensor, interpolation=cv2.INTER_AREA)
+        else:
+            tensor[:scaled_h, :scaled_w] = cv2.resize(region, (scaled_w, scaled_h), interpolation=cv2.INTER_AREA)
+            tensor[scaled_h:, :] = 0
+            tensor[:scaled_h, scaled_w:] = 0
+        return tensor, scale
+
     def _calculate_box_size(self, r: Rect, ideal_box_w, ideal_box_h, clip_w, clip_h):
         (box_w, box_h) = r.width, r.height
 
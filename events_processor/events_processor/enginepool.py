@@ -0,0 +1,120 @@
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict, List, NewType, Optional, Tuple
+
+from injector import inject, ProviderOf
+
+from events_processor.configtools import ConfigProvider
+from events_processor.interfaces import Engine
+
+EngineInstance = NewType('EngineInstance', Engine)
+OverflowEngineInstance = NewType('OverflowEngineInstance', Engine)
+
+_METRICS_LOG_SECONDS = 300
+
+
+class EngineSlot:
+    def __init__(self, index: int, engine: Engine, overflow: bool = False):
+        self.index = index
+        self.engine = engine
+        self.overflow = overflow
+        self.lock = Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    @property
+    def metrics(self) -> Dict[str, float]:
+        return {'engine': self.index, 'overflow': self.overflow, 'calls': self.calls, 'in_flight': self.in_flight,
+                'busy_seconds': self.busy_seconds, 'wait_seconds': self.wait_seconds}
+
+
+class EnginePool(Engine):
+    log = logging.getLogger("events_processor.EnginePool")
+
+    @inject
+    def __init__(self,
+                 config: ConfigProvider,
+                 engine_provider: ProviderOf[EngineInstance],
+                 overflow_engine_provider: ProviderOf[OverflowEngineInstance]):
+        self._config = config
+        self._primary_slots = [EngineSlot(i, engine_provider.get()) for i in range(max(config.engine_count, 1))]
+        self._overflow_slots = [EngineSlot(len(self._primary_slots) + i, overflow_engine_provider.get(), overflow=True)
+                                for i in range(config.overflow_engine_count)]
+        self._slots = self._primary_slots + self._overflow_slots
+        self._slots_lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(self._slots), thread_name_prefix='EnginePool')
+        self._metrics_logged = time.monotonic()
+
+    def detect(self, img, threshold):
+        return self._dispatch(lambda engine: engine.detect(img, threshold))
+
+    def input_shape(self) -> Optional[Tuple[int, int]]:
+        return self._primary_slots[0].engine.input_shape()
+
+    def detect_tensor(self, tensor, threshold):
+        return self._dispatch(lambda engine: engine.detect_tensor(tensor, threshold))
+
+    def detect_batch(self, tensors, threshold):
+        parts_count = min(len(self._slots), len(tensors))
+        if parts_count <= 1:
+            return self._dispatch(lambda engine: engine.detect_batch(tensors, threshold))
+
+        part_size = math.ceil(len(tensors) / parts_count)
+        futures = [self._executor.submit(self._dispatch, lambda engine, p=tensors[i:i + part_size]:
+                                         engine.detect_batch(p, threshold))
+                   for i in range(0, len(tensors), part_size)]
+        return [result for future in futures for result in future.result()]
+
+    def get_pending_processing_seconds(self) -> float:
+        return max(self.get_pending_processing_seconds_per_instance())
+
+    def get_pending_processing_seconds_per_instance(self) -> List[float]:
+        return [slot.engine.get_pending_processing_seconds() for slot in self._slots]
+
+    def metrics(self) -> List[Dict[str, float]]:
+        with self._slots_lock:
+            return [slot.metrics for slot in self._slots]
+
+    def _acquire_slot(self) -> EngineSlot:
+        with self._slots_lock:
+            slot = self._least_loaded(self._primary_slots)
+            if self._overflow_slots and slot.in_flight >= self._config.overflow_queue_depth:
+                slot = self._least_loaded(self._overflow_slots + [slot])
+            slot.in_flight += 1
+            return slot
+
+    @staticmethod
+    def _least_loaded(slots: List[EngineSlot]) -> EngineSlot:
+        return min(slots, key=lambda s: (s.in_flight, s.busy_seconds))
+
+    def _dispatch(self, call: Callable[[Engine], Any]) -> Any:
+        slot = self._acquire_slot()
+        wait_start = time.monotonic()
+        try:
+            with slot.lock:
+                start = time.monotonic()
+                try:
+                    return call(slot.engine)
+                finally:
+                    self._record_call(slot, start - wait_start, time.monotonic() - start)
+        finally:
+            with self._slots_lock:
+                slot.in_flight -= 1
+            self._log_metrics()
+
+    def _record_call(self, slot: EngineSlot, wait_seconds: float, busy_seconds: float) -> None:
+        with self._slots_lock:
+            slot.calls += 1
+            slot.wait_seconds += wait_seconds
+            slot.busy_seconds += busy_seconds
+
+    def _log_metrics(self) -> None:
+        now = time.monotonic()
+        if now - self._metrics_logged >= _METRICS_LOG_SECONDS:
+            self._metrics_logged = now
+            self.log.info(f"Engine pool metrics: {self.metrics()}")
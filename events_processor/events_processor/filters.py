@@ -1,8 +1,9 @@
 import logging
-from typing import Dict
+from typing import Dict, List, Tuple, Any
 
 from injector import inject
 from shapely import geometry
+from shapely.prepared import prep
 
 from events_processor.configtools import get_config, ConfigProvider
 from events_processor.interfaces import ZoneReader
@@ -25,6 +26,8 @@ class DetectionFilter:
         self._preprocessor = preprocessor
         self._zone_reader = zone_reader
         self._config = config
+        self._zone_polygons_source = None
+        self._prepared_zone_polygons: Dict[str, List[Tuple[str, Any]]] = {}
 
     def _read_labels(self) -> Dict[int, str]:
         with open(self._config.label_file, 'r', encoding="utf-8") as f:
@@ -55,9 +58,10 @@ class DetectionFilter:
         monitor_id = frame_info.event_info.monitor_id
         details = ""
 
-        alarm_box = frame_info.alarm_box
-        if alarm_box:
-            (detection_box, intersection_box) = self._calculate_boxes(alarm_box, detection)
+        if frame_info.alarm_boxes:
+            (alarm_box, detection_box, intersection_box) = max(
+                ((alarm_box, *self._calculate_boxes(alarm_box, detection)) for alarm_box in frame_info.alarm_boxes),
+                key=lambda boxes: boxes[2].area)
             if intersection_box.area > INTERSECTION_DISCARDED_THRESHOLD:
                 detection.alarm_ratio = self._ratio(alarm_box.area, intersection_box.area)
                 detection.detection_ratio = self._ratio(detection_box.area, intersection_box.area)
@@ -112,13 +116,22 @@ class DetectionFilter:
         monitor_id = frame_info.event_info.monitor_id
         detection_box = geometry.box(*detection.rect.box_tuple)
 
-        zone_polygons = self._config.excluded_zone_polygons.get(monitor_id, [])
-        for zone_poly in zone_polygons:
-            polygon = self._transformed_poly(zone_poly.zone, zone_poly.polygon)
-            if detection_box.intersects(polygon.shapely_poly):
-                detection.discard_reasons.append(f"intersects excluded polygon: {zone_poly.zone.name}")
+        for (zone_name, polygon) in self._zone_polygons(monitor_id):
+            if polygon.intersects(detection_box):
+                detection.discard_reasons.append(f"intersects excluded polygon: {zone_name}")
                 return
 
+    def _zone_polygons(self, monitor_id: str) -> List[Tuple[str, Any]]:
+        zone_polygons = self._config.excluded_zone_polygons
+        if zone_polygons is not self._zone_polygons_source:
+            self._prepared_zone_polygons = {
+                zone_monitor_id: [(zp.zone.name, prep(self._transformed_poly(zp.zone, zp.polygon).shapely_poly))
+                                  for zp in polys]
+                for (zone_monitor_id, polys) in zone_polygons.items()
+            }
+            self._zone_polygons_source = zone_polygons
+        return self._prepared_zone_polygons.get(monitor_id, [])
+
     def _transformed_poly(self, zone: ZoneInfo, poly: Polygon):
         return Polygon(self._preprocessor.transform_points(zone.monitor_id, zone.width, zone.height, poly.points))
 
@@ -0,0 +1,101 @@
+import logging
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Tuple, Optional, Set
+
+from injector import inject
+
+from events_processor.configtools import ConfigProvider
+from events_processor.interfaces import ImageReader
+from events_processor.models import FrameInfo
+
+
+class CandidateImageStore:
+    log = logging.getLogger("events_processor.CandidateImageStore")
+
+    @inject
+    def __init__(self, config: ConfigProvider, image_reader: ImageReader):
+        self._config = config
+        self._image_reader = image_reader
+        self._lock = Lock()
+        self._images: OrderedDict[Tuple[str, str], bytes] = OrderedDict()
+        self._spilled: Set[Tuple[str, str]] = set()
+        self._stored_bytes = 0
+
+    def put(self, frame_info: FrameInfo) -> bool:
+        data = self._image_reader.read_encoded(frame_info.image_path)
+        if data is None:
+            return False
+
+        key = self._key(frame_info)
+        with self._lock:
+            self._discard(key)
+            self._images[key] = data
+            self._stored_bytes += len(data)
+            self._enforce_budget()
+
+        frame_info.image_store = self
+        return True
+
+    def get(self, frame_info: FrameInfo) -> Optional[bytes]:
+        key = self._key(frame_info)
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+            if key not in self._spilled:
+                return None
+
+        try:
+            with open(self._spill_path(key), 'rb') as f:
+                return f.read()
+        except OSError as e:
+            self.log.warning(f"Could not read spilled candidate image {frame_info}: {e}")
+            return None
+
+    def discard(self, frame_info: FrameInfo) -> None:
+        with self._lock:
+            self._discard(self._key(frame_info))
+
+    @property
+    def stored_bytes(self) -> int:
+        return self._stored_bytes
+
+    def _discard(self, key: Tuple[str, str]) -> None:
+        data = self._images.pop(key, None)
+        if data is not None:
+            self._stored_bytes -= len(data)
+
+        if key in self._spilled:
+            self._spilled.remove(key)
+            try:
+                os.remove(self._spill_path(key))
+            except OSError:
+                pass
+
+    def _enforce_budget(self) -> None:
+        budget = self._config.candidate_store_mb * 1024 * 1024
+        while self._stored_bytes > budget and self._images:
+            (key, data) = self._images.popitem(last=False)
+            self._stored_bytes -= len(data)
+            self._spill(key, data)
+
+    def _spill(self, key: Tuple[str, str], data: bytes) -> None:
+        if not self._config.candidate_spill_dir:
+            return
+
+        try:
+            os.makedirs(self._config.candidate_spill_dir, exist_ok=True)
+            with open(self._spill_path(key), 'wb') as f:
+                f.write(data)
+            self._spilled.add(key)
+        except OSError as e:
+            self.log.warning(f"Could not spill candidate image {key}: {e}")
+
+    def _spill_path(self, key: Tuple[str, str]) -> str:
+        return os.path.join(self._config.candidate_spill_dir, f"candidate_{key[0]}_{key[1]}.jpg")
+
+    @staticmethod
+    def _key(frame_info: FrameInfo) -> Tuple[str, str]:
+        return frame_info.event_id, frame_info.frame_id
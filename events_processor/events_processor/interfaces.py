@@ -1,9 +1,11 @@
+import os
 from abc import abstractmethod, ABC
-from typing import Any, Iterable, Optional
+from typing import Any, Iterable, Optional, List, Dict, Tuple
 
+from PIL import Image
 from requests import Response
 
-from events_processor.models import FrameInfo, ZoneInfo, Rect, MonitorInfo
+from events_processor.models import FrameInfo, ZoneInfo, Rect, MonitorInfo, Point
 
 
 class Detector(ABC):
@@ -11,12 +13,40 @@ class Detector(ABC):
     def detect(self, frame_info: FrameInfo) -> None:
         raise NotImplemented()
 
+    def decode_reduction(self, frame_info: FrameInfo) -> int:
+        return 1
+
+    def decode_roi(self, frame_info: FrameInfo, reduction: int) -> Optional[Rect]:
+        return None
+
+    def expected_inferences(self, frame_info: FrameInfo) -> int:
+        return 1
+
 
 class ImageReader(ABC):
     @abstractmethod
-    def read(self, file_name: str) -> Any:
+    def read(self, file_name: str, reduction: int = 1, dst: Any = None) -> Any:
         raise NotImplemented()
 
+    def read_encoded(self, file_name: str) -> Optional[bytes]:
+        if os.path.isfile(file_name):
+            with open(file_name, 'rb') as f:
+                return f.read()
+        return None
+
+    @abstractmethod
+    def decode(self, data: bytes, reduction: int = 1) -> Any:
+        raise NotImplementedError()
+
+    def read_region(self, file_name: str, roi: Rect, reduction: int = 1) -> Tuple[Any, Point]:
+        image = self.read(file_name, reduction)
+        if image is None:
+            return None, Point(0, 0)
+
+        region = roi.scaled(1 / reduction)
+        return (image[max(region.top, 0):region.bottom + 1, max(region.left, 0):region.right + 1],
+                Point(max(region.left, 0) * reduction, max(region.top, 0) * reduction))
+
 
 class NotificationSender(ABC):
     @abstractmethod
@@ -44,21 +74,43 @@ class MonitorReader(ABC):
 
 class AlarmBoxReader(ABC):
     @abstractmethod
-    def read(self, event_id: str, frame_id: str, excl_zone_prefix) -> Optional[Rect]:
+    def read(self, event_id: str, frame_id: str, excl_zone_prefix) -> List[Rect]:
         raise NotImplemented()
 
+    def read_many(self, event_id: str, frame_ids: Iterable[str], excl_zone_prefix) -> Dict[str, List[Rect]]:
+        return {frame_id: self.read(event_id, frame_id, excl_zone_prefix) for frame_id in frame_ids}
+
 
 class ResourceReader(ABC):
     @abstractmethod
     def read(self, url: str) -> Optional[Response]:
         raise NotImplemented()
 
+    def read_many(self, urls: Iterable[str]) -> List[Optional[Response]]:
+        return [self.read(url) for url in urls]
+
 
 class Engine(ABC):
     @abstractmethod
     def detect(self, img, threshold):
         raise NotImplemented
 
+    def input_shape(self) -> Optional[Tuple[int, int]]:
+        return None
+
+    def detect_tensor(self, tensor, threshold):
+        (height, width) = tensor.shape[:2]
+        candidates = self.detect(Image.fromarray(tensor), threshold)
+        for candidate in candidates:
+            candidate.bounding_box = candidate.bounding_box / (width, height)
+        return candidates
+
+    def detect_batch(self, tensors, threshold):
+        return [self.detect_tensor(tensor, threshold) for tensor in tensors]
+
     @abstractmethod
     def get_pending_processing_seconds(self) -> float:
         raise NotImplemented
+
+    def get_pending_processing_seconds_per_instance(self) -> List[float]:
+        return [self.get_pending_processing_seconds()]
@@ -1,5 +1,8 @@
+import itertools
 from dataclasses import dataclass, field
 from enum import Enum, auto
+from collections import OrderedDict
+from heapq import heappush, heappop
 from queue import Queue
 from threading import Lock
 from typing import Any, Sequence, Dict, Tuple, NewType, Iterable, List, Optional, Set
@@ -74,6 +77,9 @@ class Rect:
         return Rect(*self.top_left.moved_by(x, y).tuple,
                     *self.bottom_right.moved_by(x, y).tuple)
 
+    def scaled(self, factor: float) -> 'Rect':
+        return Rect(*(int(round(v * factor)) for v in self.box_tuple))
+
 
 @dataclass
 class Polygon:
@@ -111,9 +117,15 @@ class FrameInfo:
     image_path: str
     event_info: "EventInfo"
     image: Any = None
+    image_scale: int = 1
+    image_origin: Point = field(default_factory=lambda: Point(0, 0))
+    pending_rotation: float = 0
+    image_pool: Any = None
+    image_store: Any = None
+    inference_budget_claimed: bool = False
     chunk_rects: List[Rect] = field(default_factory=list)
     detections: Sequence[Detection] = field(default_factory=list)
-    alarm_box: Optional[Rect] = None
+    alarm_boxes: List[Rect] = field(default_factory=list)
     score: float = 0
 
     def __str__(self):
@@ -133,9 +145,38 @@ class FrameInfo:
                f"alr:{det.alarm_ratio:.2f} detr:{det.detection_ratio:.2f}" if det.alarm_ratio is not None else ""
 
     def _alarm_box_perc(self):
-        (h, w, _) = self.image.shape
+        (h, w) = (self.event_info.height, self.event_info.width)
         return self.alarm_box.area / (h * w) * 100 if h != 0 and w != 0 else 0
 
+    def release_image(self) -> None:
+        if self.image_pool is not None:
+            self.image_pool.release(self.image)
+        self.image = None
+
+    def release_stored_image(self) -> None:
+        if self.image_store is not None:
+            self.image_store.discard(self)
+            self.image_store = None
+        self.release_image()
+
+    @property
+    def image_is_full_frame(self) -> bool:
+        return self.image is not None and self.image_scale == 1 and self.image_origin == Point(0, 0) and \
+               self.pending_rotation == 0
+
+    def to_image_rect(self, rect: Rect) -> Rect:
+        return rect.moved_by(-self.image_origin.x, -self.image_origin.y).scaled(1 / self.image_scale)
+
+    def from_image_rect(self, rect: Rect) -> Rect:
+        return rect.scaled(self.image_scale).moved_by(self.image_origin.x, self.image_origin.y)
+
+    @property
+    def alarm_box(self) -> Optional[Rect]:
+        if not self.alarm_boxes:
+            return None
+        return Rect(min(r.left for r in self.alarm_boxes), min(r.top for r in self.alarm_boxes),
+                    max(r.right for r in self.alarm_boxes), max(r.bottom for r in self.alarm_boxes))
+
     @property
     def verdict(self):
         return "accepted" if self.accepted_detections else "discarded"
@@ -160,6 +201,10 @@ class FrameInfo:
     def type(self):
         return self.frame_json['Type']
 
+    @property
+    def motion_score(self) -> float:
+        return float(self.frame_json.get('Score') or 0)
+
 
 class NotificationStatus(Enum):
     NONE = auto()
@@ -188,10 +233,14 @@ class EventInfo:
     planned_notification: float = 0
     notification_status: NotificationStatus = NotificationStatus.NONE
     all_frames_were_read: bool = False
+    last_frame_id: int = -1
+    inferred_frames: int = 0
     lock: Any = field(default_factory=Lock)
     candidate_frames: List[FrameInfo] = field(default_factory=list)
     retrieved_frame_ids: Set[str] = field(default_factory=set)
     processed_frame_ids: Set[str] = field(default_factory=set)
+    alarm_boxes: Dict[str, List[Rect]] = field(default_factory=dict)
+    inference_reference: Any = None
 
     def __str__(self) -> str:
         return f"(mid: {self.monitor_id}, eid: {self.event_id})"
@@ -228,16 +277,19 @@ class EventInfo:
                 and len(self.processed_frame_ids) == len(self.retrieved_frame_ids))
 
     def release_resources(self):
-        self.candidate_frames.clear()
+        for frame in self.candidate_frames:
+            frame.release_stored_image()
         self.candidate_frames.clear()
         self.processed_frame_ids.clear()
         self.retrieved_frame_ids.clear()
+        self.alarm_boxes.clear()
+        self.inference_reference = None
 
     def release_less_scored_frames_images(self):
         max_score_frame = self.max_score_frame()
         for frame in self.candidate_frames:
-            if frame != max_score_frame:
-                frame.image = None
+            if frame is not max_score_frame:
+                frame.release_stored_image()
 
 
 @dataclass
@@ -261,5 +313,62 @@ class ZonePolygon:
     polygon: Polygon
 
 
+class FramePriorityQueue(Queue):
+    def _init(self, maxsize):
+        self._counter = itertools.count()
+        self._event_frames: OrderedDict[EventInfo, List[Tuple[float, int, FrameInfo]]] = OrderedDict()
+        self._stop_markers = 0
+        self._size = 0
+
+    def _qsize(self):
+        return self._size
+
+    def _put(self, frame_info: Optional[FrameInfo]):
+        self._size += 1
+        if frame_info is None:
+            self._stop_markers += 1
+            return
+
+        frames = self._event_frames.setdefault(frame_info.event_info, [])
+        heappush(frames, (-frame_info.motion_score, next(self._counter), frame_info))
+
+    def _get(self) -> Optional[FrameInfo]:
+        self._size -= 1
+        if self._stop_markers > 0:
+            self._stop_markers -= 1
+            return None
+
+        (event_info, frames) = next(iter(self._event_frames.items()))
+        frame_info = heappop(frames)[2]
+        if frames:
+            self._event_frames.move_to_end(event_info)
+        else:
+            del self._event_frames[event_info]
+        return frame_info
+
+    def cancel_event(self, event_info: EventInfo) -> List[FrameInfo]:
+        with self.mutex:
+            cancelled = [entry[2] for entry in self._event_frames.pop(event_info, [])]
+            if not cancelled:
+                return []
+
+            self._size -= len(cancelled)
+            self.unfinished_tasks -= len(cancelled)
+            if self.unfinished_tasks == 0:
+                self.all_tasks_done.notify_all()
+            return cancelled
+
+    def put_many(self, frame_infos: Iterable[FrameInfo]) -> None:
+        with self.not_full:
+            n_put = 0
+            for frame_info in frame_infos:
+                self._put(frame_info)
+                n_put += 1
+            self.unfinished_tasks += n_put
+            self.not_empty.notify(n_put)
+
+
 NotificationQueue = NewType('NotificationQueue', Queue)
-FrameQueue = NewType('FrameQueue', Queue)
+FrameQueue = NewType('FrameQueue', FramePriorityQueue)
+DecodedFrameQueue = NewType('DecodedFrameQueue', Queue)
+PreprocessedFrameQueue = NewType('PreprocessedFrameQueue', Queue)
@@ -10,12 +10,13 @@ from threading import Thread
 from typing import Optional, Set
 
 import cv2
-import requests
 from injector import inject
 
 from events_processor.configtools import ConfigProvider
 from events_processor.interfaces import NotificationSender, SystemTime
 from events_processor.models import EventInfo, NotificationQueue, NotificationStatus, FrameInfo
+from events_processor.processor import FrameImageLoader
+from events_processor.reader import HttpClient
 from events_processor.renderer import DetectionRenderer
 
 
@@ -37,9 +38,10 @@ class MailNotificationSender(NotificationSender):
         text = MIMEText(message)
         msg.attach(text)
 
-        img_data = cv2.imencode(".jpg", frame_info.image)[1].tostring()
-        image = MIMEImage(img_data, name="notification.jpg")
-        msg.attach(image)
+        if frame_info.image is not None:
+            img_data = cv2.imencode(".jpg", frame_info.image)[1].tostring()
+            image = MIMEImage(img_data, name="notification.jpg")
+            msg.attach(image)
 
         try:
             s = smtplib.SMTP(self._config.host, self._config.port, timeout=self._config.timeout)
@@ -60,7 +62,8 @@ class FSNotificationSender(NotificationSender):
     log = logging.getLogger('events_processor.FSNotificationSender')
 
     def send(self, frame_info: FrameInfo, subject: str, message: str) -> bool:
-        cv2.imwrite(f"mailed_{frame_info.event_id}_{frame_info.event_id}.jpg", frame_info.image)
+        if frame_info.image is not None:
+            cv2.imwrite(f"mailed_{frame_info.event_id}_{frame_info.event_id}.jpg", frame_info.image)
         self.log.info(f"Notification subject: {subject}")
         self.log.info(f"Notification message: {message}")
         return True
@@ -70,14 +73,15 @@ class EventUpdater:
     log = logging.getLogger('events_processor.EventUpdater')
 
     @inject
-    def __init__(self, config: ConfigProvider):
+    def __init__(self, config: ConfigProvider, http_client: HttpClient):
         self._config = config
+        self._http_client = http_client
 
     def update_event(self, event_info: EventInfo, **update_spec) -> bool:
         try:
             url = self._config.event_details_url.format(eventId=event_info.event_id)
             mark_as_mailed_json = {'Event': update_spec}
-            response = requests.post(url, json=mark_as_mailed_json)
+            response = self._http_client.post(url, json=mark_as_mailed_json)
             response_json = json.loads(response.content)
             return 200 == response.status_code and 'Saved' == response_json.get('message', '')
         except Exception as e:
@@ -121,6 +125,7 @@ class NotificationWorker(Thread):
                  notification_queue: NotificationQueue,
                  detection_notifier: DetectionNotifier,
                  detection_renderer: DetectionRenderer,
+                 frame_image_loader: FrameImageLoader,
                  system_time: SystemTime,
                  config: ConfigProvider):
         super().__init__()
@@ -130,6 +135,7 @@ class NotificationWorker(Thread):
 
         self._detection_notifier = detection_notifier
         self._detection_renderer = detection_renderer
+        self._frame_image_loader = frame_image_loader
 
         self._notification_queue = notification_queue
         self._notifications: Set[EventInfo] = set()
@@ -167,7 +173,13 @@ class NotificationWorker(Thread):
             notification_frame = event_info.max_score_frame()
             event_info.notification_status = NotificationStatus.SENDING
 
-        self._detection_renderer.annotate_image(notification_frame)
+        if self._frame_image_loader.ensure_full_resolution(notification_frame):
+            self._detection_renderer.annotate_image(notification_frame)
+        else:
+            self.log.error(f"Could not read notification frame image, sending without attachment: "
+                           f"{notification_frame}")
+            notification_frame.release_image()
+
         notification_succeeded = self._detection_notifier.notify(notification_frame)
         if notification_succeeded:
             event_info.notification_status = NotificationStatus.SENT
@@ -1,41 +1,130 @@
+from functools import lru_cache
 from typing import Tuple, Any, Iterable
 
 import cv2
+import numpy as np
 from injector import inject
 
-from events_processor.configtools import ConfigProvider
-from events_processor.models import FrameInfo, Point
+from events_processor.bufferpool import ImageBufferPool
+from events_processor.configtools import ConfigProvider, get_config
+from events_processor.models import FrameInfo, Point, Rect
+
+INTERPOLATIONS = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'cubic': cv2.INTER_CUBIC,
+    'lanczos': cv2.INTER_LANCZOS4,
+}
+
+RIGHT_ANGLE_ROTATIONS = {
+    90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_CLOCKWISE,
+}
+
+REGION_WARP_MARGIN = 2
 
 
 class RotatingPreprocessor:
     @inject
-    def __init__(self, config: ConfigProvider):
+    def __init__(self, config: ConfigProvider, buffer_pool: ImageBufferPool):
         self._config = config
+        self._buffer_pool = buffer_pool
 
-    def preprocess(self, frame_info: FrameInfo) -> None:
+    def preprocess(self, frame_info: FrameInfo, full_image: bool = False) -> None:
         monitor_id = frame_info.event_info.monitor_id
         rotation = self._config.rotations.get(monitor_id, 0)
-        if rotation != 0:
-            frame_info.image = self.rotate_and_expand_image(frame_info.image, rotation)
+        frame_info.pending_rotation = 0
+        if rotation == 0:
+            return
+
+        if not full_image and rotation % 90 != 0 and \
+                get_config(self._config.rotation_modes, monitor_id, 'full') == 'regions':
+            frame_info.pending_rotation = rotation
+        else:
+            rotated = self.rotate_and_expand_image(frame_info.image, rotation, self._interpolation(monitor_id),
+                                                   self._buffer_pool.acquire(self._rotated_shape(frame_info, rotation)))
+            frame_info.release_image()
+            frame_info.image = rotated
+            frame_info.image_pool = self._buffer_pool
+
+    def image_size(self, frame_info: FrameInfo) -> Tuple[int, int]:
+        h, w = frame_info.image.shape[:2]
+        if frame_info.pending_rotation == 0:
+            return w, h
+        bound_h, bound_w, _ = self._get_rotation_matrix(frame_info.pending_rotation, w, h)
+        return bound_w, bound_h
+
+    def extract_region(self, frame_info: FrameInfo, rect: Rect) -> Any:
+        image = frame_info.image
+        if frame_info.pending_rotation == 0:
+            return image[rect.top:rect.bottom, rect.left:rect.right]
+
+        h, w = image.shape[:2]
+        rotation_mat = self._get_rotation_matrix(frame_info.pending_rotation, w, h)[2]
+        inverse_mat = cv2.invertAffineTransform(rotation_mat)
+        corners = np.array([pt.tuple for pt in rect.points], dtype=float) @ inverse_mat[:, :2].T + inverse_mat[:, 2]
+
+        (left, top) = np.maximum(np.floor(corners.min(axis=0)).astype(int) - REGION_WARP_MARGIN, 0)
+        (right, bottom) = np.minimum(np.ceil(corners.max(axis=0)).astype(int) + REGION_WARP_MARGIN, (w - 1, h - 1))
+        region_size = (rect.right - rect.left, rect.bottom - rect.top)
+        if right < left or bottom < top:
+            return np.zeros((region_size[1], region_size[0]) + image.shape[2:], dtype=image.dtype)
+
+        region_mat = rotation_mat.copy()
+        region_mat[:, 2] += rotation_mat[:, :2] @ (left, top) - (rect.left, rect.top)
+        return cv2.warpAffine(image[top:bottom + 1, left:right + 1], region_mat, region_size,
+                              dst=self._buffer_pool.acquire((region_size[1], region_size[0]) + image.shape[2:]),
+                              flags=self._interpolation(frame_info.event_info.monitor_id))
+
+    def release_region(self, region: Any) -> None:
+        self._buffer_pool.release(region)
+
+    def _rotated_shape(self, frame_info: FrameInfo, angle: float) -> Tuple[int, ...]:
+        image = frame_info.image
+        h, w = image.shape[:2]
+        if angle % 180 == 0:
+            return image.shape
+        if angle % 90 == 0:
+            return (w, h) + image.shape[2:]
+        bound_h, bound_w, _ = self._get_rotation_matrix(angle, w, h)
+        return (bound_h, bound_w) + image.shape[2:]
+
+    def _interpolation(self, monitor_id: str) -> int:
+        return INTERPOLATIONS[get_config(self._config.rotation_interpolations, monitor_id, 'cubic')]
 
     @classmethod
-    def rotate_and_expand_image(cls, mat: Any, angle: float) -> Any:
+    def rotate_and_expand_image(cls, mat: Any, angle: float, interpolation: int = cv2.INTER_CUBIC,
+                                dst: Any = None) -> Any:
+        if angle % 360 == 0:
+            if dst is None:
+                return mat
+            np.copyto(dst, mat)
+            return dst
+        if angle % 90 == 0:
+            return cv2.rotate(mat, RIGHT_ANGLE_ROTATIONS[int(angle) % 360], dst=dst)
+
         h, w = mat.shape[:2]
         bound_h, bound_w, rotation_mat = cls._get_rotation_matrix(angle, w, h)
 
-        return cv2.UMat.get(
-            cv2.warpAffine(cv2.UMat(mat), rotation_mat, (bound_w, bound_h), flags=cv2.INTER_CUBIC))
+        return cv2.warpAffine(mat, rotation_mat, (bound_w, bound_h), dst=dst, flags=interpolation)
 
     def transform_point(self, monitor_id: str, w: int, h: int, point: Point) -> Point:
+        return self.transform_points(monitor_id, w, h, (point,))[0]
+
+    def transform_points(self, monitor_id: str, w: int, h: int, points: Iterable[Point]) -> Tuple[Point, ...]:
+        point_tuple = tuple(points)
+        if self._config.rotations.get(monitor_id, 0) == 0 or not point_tuple:
+            return point_tuple
+        coords = self.transform_coords(monitor_id, w, h, np.array([pt.tuple for pt in point_tuple]))
+        return tuple(Point(x, y) for (x, y) in coords.tolist())
+
+    def transform_coords(self, monitor_id: str, w: int, h: int, coords: Any) -> Any:
         angle = self._config.rotations.get(monitor_id, 0)
         if angle == 0:
-            return point
+            return coords
         rotation_matrix = self._get_rotation_matrix(angle, w, h)[2]
-        result = rotation_matrix.dot((point.x, point.y, 1))
-        return Point(*map(lambda x: int(round(x)), result))
-
-    def transform_points(self, monitor_id: str, w: int, h: int, points: Iterable[Point]) -> Iterable[Point]:
-        return tuple(self.transform_point(monitor_id, w, h, pt) for pt in points)
+        return np.rint(coords @ rotation_matrix[:, :2].T + rotation_matrix[:, 2]).astype(int)
 
     def transform_frame_points(self, frame_info: FrameInfo, points: Iterable[Point]) -> Iterable[Point]:
         width = frame_info.event_info.width
@@ -44,6 +133,7 @@ class RotatingPreprocessor:
         return self.transform_points(monitor_id, width, height, points)
 
     @staticmethod
+    @lru_cache(maxsize=256)
     def _get_rotation_matrix(angle: float, w: int, h: int) -> Tuple[int, int, Any]:
         image_center = (w / 2, h / 2)
         rotation_mat = cv2.getRotationMatrix2D(image_center, angle, 1.)
@@ -53,4 +143,5 @@ class RotatingPreprocessor:
         bound_h = int(h * abs_cos + w * abs_sin)
         rotation_mat[0, 2] += bound_w / 2 - image_center[0]
         rotation_mat[1, 2] += bound_h / 2 - image_center[1]
+        rotation_mat.setflags(write=False)
         return bound_h, bound_w, rotation_mat
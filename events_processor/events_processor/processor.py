@@ -1,87 +1,316 @@
 import logging
 import os
+from abc import ABC, abstractmethod
 import time
+from queue import Full
 from threading import Thread
-from typing import Any
+from typing import Any, Optional, Tuple
 
 import cv2
+import numpy as np
 from injector import inject
 
+from events_processor.bufferpool import ImageBufferPool
 from events_processor.configtools import get_config, ConfigProvider
 from events_processor.filters import DetectionFilter
+from events_processor.imagestore import CandidateImageStore
 from events_processor.interfaces import Detector, ImageReader
-from events_processor.models import FrameInfo, FrameQueue, NotificationQueue, NotificationStatus, EventInfo
+from events_processor.models import FrameInfo, FrameQueue, NotificationQueue, NotificationStatus, EventInfo, Rect, \
+    Point, DecodedFrameQueue, PreprocessedFrameQueue
 from events_processor.preprocessor import RotatingPreprocessor
+from events_processor.suppression import DuplicateDetectionSuppressor
+
+
+_REDUCED_DECODE_FLAGS = {1: cv2.IMREAD_COLOR,
+                         2: cv2.IMREAD_REDUCED_COLOR_2,
+                         4: cv2.IMREAD_REDUCED_COLOR_4,
+                         8: cv2.IMREAD_REDUCED_COLOR_8}
 
 
 class FSImageReader(ImageReader):
-    def read(self, file_name: str) -> Any:
-        if os.path.isfile(file_name):
-            return cv2.imread(file_name)
+    log = logging.getLogger("events_processor.FSImageReader")
 
+    def __init__(self):
+        self._turbo_jpeg = self._load_turbo_jpeg()
+
+    def _load_turbo_jpeg(self) -> Any:
+        try:
+            from turbojpeg import TurboJPEG
+            return TurboJPEG()
+        except (ImportError, RuntimeError, OSError) as e:
+            self.log.info(f"TurboJPEG unavailable, region of interest decoding falls back to full decode: {e}")
+            return None
+
+    def read(self, file_name: str, reduction: int = 1, dst: Any = None) -> Any:
+        if not os.path.isfile(file_name):
+            return None
+
+        if dst is not None:
+            try:
+                return cv2.imread(file_name, dst, _REDUCED_DECODE_FLAGS[reduction])
+            except (cv2.error, TypeError):
+                pass
+        return cv2.imread(file_name, _REDUCED_DECODE_FLAGS[reduction])
+
+    def decode(self, data: bytes, reduction: int = 1) -> Any:
+        return cv2.imdecode(np.frombuffer(data, np.uint8), _REDUCED_DECODE_FLAGS[reduction])
+
+    def read_region(self, file_name: str, roi: Rect, reduction: int = 1) -> Tuple[Any, Point]:
+        if self._turbo_jpeg is not None and os.path.isfile(file_name):
+            try:
+                return self._decode_cropped(file_name, roi, reduction)
+            except OSError as e:
+                self.log.warning(f"Cropped decode of {file_name} failed, decoding full frame: {e}")
+
+        return super().read_region(file_name, roi, reduction)
+
+    def _decode_cropped(self, file_name: str, roi: Rect, reduction: int) -> Tuple[Any, Point]:
+        from turbojpeg import tjMCUWidth, tjMCUHeight
+
+        with open(file_name, 'rb') as f:
+            jpeg_data = f.read()
+
+        (width, height, subsample, _) = self._turbo_jpeg.decode_header(jpeg_data)
+        left = max(roi.left, 0) - max(roi.left, 0) % tjMCUWidth[subsample]
+        top = max(roi.top, 0) - max(roi.top, 0) % tjMCUHeight[subsample]
+        crop_w = min(roi.right + 1, width) - left
+        crop_h = min(roi.bottom + 1, height) - top
+
+        cropped = self._turbo_jpeg.crop(jpeg_data, left, top, crop_w, crop_h)
+        return self._turbo_jpeg.decode(cropped, scaling_factor=(1, reduction)), Point(left, top)
 
-class FrameProcessorWorker(Thread):
-    log = logging.getLogger("events_processor.FrameProcessorWorker")
 
+class FrameImageLoader:
     @inject
     def __init__(self,
-                 frame_queue: FrameQueue,
-                 notification_queue: NotificationQueue,
-                 detector: Detector,
                  image_reader: ImageReader,
-                 detection_filter: DetectionFilter,
                  preprocessor: RotatingPreprocessor,
-                 config: ConfigProvider):
+                 buffer_pool: ImageBufferPool):
+        self._image_reader = image_reader
+        self._preprocessor = preprocessor
+        self._buffer_pool = buffer_pool
 
-        super().__init__()
-        self._stop_requested = False
+    def load(self, frame_info: FrameInfo, reduction: int = 1, roi: Optional[Rect] = None) -> bool:
+        if not self.decode(frame_info, reduction, roi):
+            return False
 
-        self._frame_queue = frame_queue
-        self._notification_queue = notification_queue
-        self._detector = detector
-        self._detection_filter = detection_filter
-        self._preprocessor = preprocessor
-        self._config = config
+        self._preprocessor.preprocess(frame_info, full_image=True)
+        return True
 
-        self._image_reader = image_reader
+    def decode(self, frame_info: FrameInfo, reduction: int = 1, roi: Optional[Rect] = None) -> bool:
+        stored_image = frame_info.image_store.get(frame_info) if frame_info.image_store is not None else None
+        if stored_image is not None and roi is None:
+            (image, origin) = (self._image_reader.decode(stored_image, reduction), Point(0, 0))
+        elif roi is None:
+            (image, origin) = (self._read_into_pooled_buffer(frame_info, reduction), Point(0, 0))
+        else:
+            (image, origin) = self._image_reader.read_region(frame_info.image_path, roi, reduction)
 
-    def _read_image_from_fs(self, file_name: str) -> Any:
-        if os.path.isfile(file_name):
-            return cv2.imread(file_name)
+        if image is None:
+            return False
+
+        frame_info.release_image()
+        frame_info.image = image
+        frame_info.image_pool = self._buffer_pool
+        frame_info.image_scale = reduction
+        frame_info.image_origin = origin
+        return True
+
+    def _read_into_pooled_buffer(self, frame_info: FrameInfo, reduction: int) -> Any:
+        event_info = frame_info.event_info
+        shape = (-(-event_info.height // reduction), -(-event_info.width // reduction), 3)
+        buffer = self._buffer_pool.acquire(shape)
+
+        image = self._image_reader.read(frame_info.image_path, reduction, buffer)
+        if image is not buffer:
+            self._buffer_pool.release(buffer)
+        return image
+
+    def preprocess(self, frame_info: FrameInfo) -> None:
+        self._preprocessor.preprocess(frame_info)
+
+    def ensure_full_resolution(self, frame_info: FrameInfo) -> bool:
+        if frame_info.image_is_full_frame:
+            return True
+        return self.load(frame_info)
+
+
+class FrameStageWorker(Thread, ABC):
+    log = logging.getLogger("events_processor.FrameStageWorker")
+
+    def __init__(self, input_queue: Any, output_queue: Any = None):
+        super().__init__()
+        self._stop_requested = False
+
+        self._input_queue = input_queue
+        self._output_queue = output_queue
 
     def run(self) -> None:
         while not self._stop_requested:
-            frame_info = self._frame_queue.get()
+            frame_info = self._input_queue.get()
             if self._stop_requested:
                 break
 
-            if frame_info.event_info.notification_status.was_sending:
-                self.log.info(f"Notification already sent for event: {frame_info.event_info}, "
-                              f"skipping processing of frame: {frame_info}")
+            if self._process_safely(frame_info):
+                self._forward(frame_info)
             else:
-                frame_info.image = self._image_reader.read(frame_info.image_path)
-                if frame_info.image is None:
-                    self.log.error(f"Could not read frame image, skipping frame {frame_info}")
-
-                for action in (self._preprocessor.preprocess,
-                               self._detector.detect,
-                               self._detection_filter.filter_detections,
-                               self._calculate_frame_score,
-                               self._record_event_frame):
-                    if action:
-                        action(frame_info)
-
-            event_info = frame_info.event_info
-            with event_info.lock:
-                event_info.processed_frame_ids.add(frame_info.frame_id)
-                if event_info.all_frames_were_read_and_processed_none_submitted():
-                    event_info.release_resources()
+                self._refund_inference_budget(frame_info)
+                frame_info.release_image()
+                self._mark_processed(frame_info)
 
         self.log.info(f"Terminating")
 
     def stop(self) -> None:
         self._stop_requested = True
-        self._frame_queue.put(None)
+        try:
+            self._input_queue.put_nowait(None)
+        except Full:
+            pass
+
+    def _process_safely(self, frame_info: FrameInfo) -> bool:
+        try:
+            return self._process(frame_info)
+        except Exception:
+            self.log.exception(f"Could not process frame {frame_info}")
+            return False
+
+    @abstractmethod
+    def _process(self, frame_info: FrameInfo) -> bool:
+        raise NotImplementedError()
+
+    def _forward(self, frame_info: FrameInfo) -> None:
+        if self._output_queue is None:
+            self._mark_processed(frame_info)
+            return
+
+        while not self._stop_requested:
+            try:
+                self._output_queue.put(frame_info, timeout=1)
+                return
+            except Full:
+                pass
+
+    @staticmethod
+    def _event_was_submitted(frame_info: FrameInfo) -> bool:
+        event_info = frame_info.event_info
+        with event_info.lock:
+            return event_info.notification_status.was_submitted
+
+    @staticmethod
+    def _refund_inference_budget(frame_info: FrameInfo) -> None:
+        event_info = frame_info.event_info
+        with event_info.lock:
+            if frame_info.inference_budget_claimed:
+                frame_info.inference_budget_claimed = False
+                event_info.inferred_frames -= 1
+
+    @staticmethod
+    def _mark_processed(frame_info: FrameInfo) -> None:
+        event_info = frame_info.event_info
+        with event_info.lock:
+            event_info.processed_frame_ids.add(frame_info.frame_id)
+            if event_info.all_frames_were_read_and_processed_none_submitted():
+                event_info.release_resources()
+
+
+class FrameDecodeWorker(FrameStageWorker):
+    log = logging.getLogger("events_processor.FrameDecodeWorker")
+
+    @inject
+    def __init__(self,
+                 frame_queue: FrameQueue,
+                 decoded_frame_queue: DecodedFrameQueue,
+                 detector: Detector,
+                 frame_image_loader: FrameImageLoader,
+                 config: ConfigProvider):
+        super().__init__(frame_queue, decoded_frame_queue)
+
+        self._detector = detector
+        self._frame_image_loader = frame_image_loader
+        self._config = config
+
+    def _process(self, frame_info: FrameInfo) -> bool:
+        if not self._frame_should_be_inferred(frame_info):
+            self.log.info(f"Notification already submitted or inference budget used for event: "
+                          f"{frame_info.event_info}, skipping processing of frame: {frame_info}")
+            return False
+
+        reduction = self._detector.decode_reduction(frame_info)
+        roi = self._detector.decode_roi(frame_info, reduction)
+        if not self._frame_image_loader.decode(frame_info, reduction, roi):
+            self.log.error(f"Could not read frame image, skipping frame {frame_info}")
+            return False
+
+        return True
+
+    def _frame_should_be_inferred(self, frame_info: FrameInfo) -> bool:
+        event_info = frame_info.event_info
+        max_inferred_frames = get_config(self._config.max_inferred_frames, event_info.monitor_id, 0)
+        with event_info.lock:
+            if event_info.notification_status.was_submitted:
+                return False
+            if max_inferred_frames and event_info.inferred_frames >= max_inferred_frames:
+                return False
+            event_info.inferred_frames += 1
+            frame_info.inference_budget_claimed = True
+            return True
+
+
+class FramePreprocessWorker(FrameStageWorker):
+    log = logging.getLogger("events_processor.FramePreprocessWorker")
+
+    @inject
+    def __init__(self,
+                 decoded_frame_queue: DecodedFrameQueue,
+                 preprocessed_frame_queue: PreprocessedFrameQueue,
+                 frame_image_loader: FrameImageLoader):
+        super().__init__(decoded_frame_queue, preprocessed_frame_queue)
+
+        self._frame_image_loader = frame_image_loader
+
+    def _process(self, frame_info: FrameInfo) -> bool:
+        if self._event_was_submitted(frame_info):
+            return False
+
+        self._frame_image_loader.preprocess(frame_info)
+        return True
+
+
+class FrameProcessorWorker(FrameStageWorker):
+    log = logging.getLogger("events_processor.FrameProcessorWorker")
+
+    @inject
+    def __init__(self,
+                 preprocessed_frame_queue: PreprocessedFrameQueue,
+                 frame_queue: FrameQueue,
+                 notification_queue: NotificationQueue,
+                 detector: Detector,
+                 duplicate_suppressor: DuplicateDetectionSuppressor,
+                 detection_filter: DetectionFilter,
+                 candidate_store: CandidateImageStore,
+                 config: ConfigProvider):
+        super().__init__(preprocessed_frame_queue)
+
+        self._frame_queue = frame_queue
+        self._notification_queue = notification_queue
+        self._detector = detector
+        self._duplicate_suppressor = duplicate_suppressor
+        self._detection_filter = detection_filter
+        self._candidate_store = candidate_store
+        self._config = config
+
+    def _process(self, frame_info: FrameInfo) -> bool:
+        if self._event_was_submitted(frame_info):
+            return False
+
+        for action in (self._detector.detect,
+                       self._duplicate_suppressor.suppress_duplicates,
+                       self._detection_filter.filter_detections,
+                       self._calculate_frame_score,
+                       self._record_event_frame):
+            if action:
+                action(frame_info)
+        return True
 
     def _calculate_frame_score(self, frame_info: FrameInfo) -> None:
         accepted_detections = frame_info.accepted_detections
@@ -94,6 +323,8 @@ class FrameProcessorWorker(Thread):
                 if not event_info.notification_status.was_sending:
                     event_info.candidate_frames.append(frame_info)
                     event_info.release_less_scored_frames_images()
+                    if frame_info is event_info.max_score_frame() and self._candidate_store.put(frame_info):
+                        frame_info.release_image()
 
                     min_accepted = get_config(self._config.min_accepted_frames, event_info.monitor_id, 1)
                     n_accepted = len(event_info.candidate_frames)
@@ -101,9 +332,14 @@ class FrameProcessorWorker(Thread):
                     if n_accepted >= min_accepted and not event_info.notification_status.was_submitted:
                         self._submit_notification(event_info)
             else:
-                frame_info.image = None
+                frame_info.release_image()
 
     def _submit_notification(self, event_info: EventInfo):
         event_info.notification_submission_time = time.monotonic()
         event_info.notification_status = NotificationStatus.SUBMITTED
         self._notification_queue.put(event_info)
+
+        cancelled_frames = self._frame_queue.cancel_event(event_info)
+        event_info.processed_frame_ids.update(f.frame_id for f in cancelled_frames)
+        if cancelled_frames:
+            self.log.debug(f"Dropped {len(cancelled_frames)} pending frames of submitted event: {event_info}")
@@ -1,26 +1,52 @@
 import json
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from threading import Thread
-from typing import Dict, Optional, Tuple, Iterable
+from typing import Dict, Optional, Tuple, Iterable, List, Callable, Any
 
 import requests
 from cachetools import TTLCache
 from injector import inject
 from requests import Response
+from requests.adapters import HTTPAdapter
 
 from events_processor.configtools import ConfigProvider
-from events_processor.interfaces import SystemTime, ResourceReader
+from events_processor.interfaces import SystemTime, ResourceReader, AlarmBoxReader
 from events_processor.models import FrameInfo, EventInfo, FrameQueue
 
 
+class HttpClient:
+    @inject
+    def __init__(self, config: ConfigProvider):
+        self._timeout = (config.http_connect_timeout, config.http_read_timeout)
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=config.http_pool_size, pool_maxsize=config.http_pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=config.http_concurrency, thread_name_prefix='HttpClient')
+
+    def get(self, url: str) -> Response:
+        return self._session.get(url, timeout=self._timeout)
+
+    def post(self, url: str, json: Any) -> Response:
+        return self._session.post(url, json=json, timeout=self._timeout)
+
+    def map(self, fn: Callable[[str], Any], urls: Iterable[str]) -> List[Any]:
+        return list(self._executor.map(fn, urls))
+
+
 class WebResourceReader(ResourceReader):
     log = logging.getLogger("events_processor.WebResourceReader")
 
+    @inject
+    def __init__(self, http_client: HttpClient):
+        self._http_client = http_client
+
     def read(self, url: str) -> Optional[Response]:
         try:
-            response = requests.get(url)
+            response = self._http_client.get(url)
             if response.status_code == 200:
                 return response
         except requests.exceptions.RequestException:
@@ -28,6 +54,9 @@ class WebResourceReader(ResourceReader):
         self.log.error(f"Could not retrieve resource: {url}")
         return None
 
+    def read_many(self, urls: Iterable[str]) -> List[Optional[Response]]:
+        return self._http_client.map(self.read, urls)
+
 
 class FrameReader:
     log = logging.getLogger("events_processor.FrameReader")
@@ -38,12 +67,16 @@ class FrameReader:
                  config: ConfigProvider):
         self._config = config
         self._resource_reader = resource_reader
-
-    def _get_past_events_json(self, page: int) -> Dict:
-        events_fetch_from = datetime.now() - timedelta(seconds=self._config.events_window_seconds)
-
-        query = self._config.event_list_url.format(startTime=datetime.strftime(events_fetch_from, '%Y-%m-%d %H:%M:%S'),
-                                                   page=page)
+        self._monitors_json: Dict[str, Dict] = {}
+
+    def _get_past_events_json(self, page: int, from_event_id: Optional[int] = None) -> Dict:
+        if from_event_id is None:
+            events_fetch_from = datetime.now() - timedelta(seconds=self._config.events_window_seconds)
+            query = self._config.event_list_url.format(
+                startTime=datetime.strftime(events_fetch_from, '%Y-%m-%d %H:%M:%S'),
+                page=page)
+        else:
+            query = self._config.event_list_from_id_url.format(eventId=from_event_id, page=page)
         query = query.replace(' ', '%20')
 
         response = self._resource_reader.read(query)
@@ -51,20 +84,25 @@ class FrameReader:
             return json.loads(response.content)
         return {}
 
-    def get_event_details_json(self, event_id: str) -> Optional[Tuple[Dict, Dict, Dict]]:
-        query = self._config.event_details_url.format(eventId=event_id)
-        response = self._resource_reader.read(query)
+    def get_event_details_json(self, event_id: str) -> Optional[Tuple[Dict, List[Dict], Dict]]:
+        response = self._resource_reader.read(self._get_event_details_url(event_id))
+        return self._parse_event_details(response)
+
+    def _get_event_details_url(self, event_id: str) -> str:
+        return self._config.event_details_url.format(eventId=event_id)
+
+    def _parse_event_details(self, response: Optional[Response]) -> Optional[Tuple[Dict, List[Dict], Dict]]:
         if response:
             data = json.loads(response.content)['event']
             return data['Event'], data['Frame'], data['Monitor']
         return None
 
-    def events_iter(self) -> Iterable[Dict]:
+    def events_iter(self, from_event_id: Optional[int] = None) -> Iterable[Dict]:
         page = 0
         page_count = 1
 
         while page < page_count:
-            event_json = self._get_past_events_json(page=page + 1)
+            event_json = self._get_past_events_json(page=page + 1, from_event_id=from_event_id)
             if not event_json:
                 break
 
@@ -80,15 +118,48 @@ class FrameReader:
             (event_json, _, _) = details
             yield event_json
 
-    def frames(self, event_info: EventInfo) -> Iterable[FrameInfo]:
-        details = self.get_event_details_json(event_info.event_id)
+    def frames(self, event_info: EventInfo) -> Optional[List[FrameInfo]]:
+        return self.frames_many((event_info,))[0]
+
+    def frames_many(self, event_infos: Iterable[EventInfo]) -> List[Optional[List[FrameInfo]]]:
+        event_infos = list(event_infos)
+        responses = self._resource_reader.read_many(self._get_frames_url(e) for e in event_infos)
+        return [self._create_frames(event_info, self._parse_frames(event_info, response))
+                for (event_info, response) in zip(event_infos, responses)]
+
+    def _get_frames_url(self, event_info: EventInfo) -> str:
+        if not self._config.frame_list_url or event_info.monitor_id not in self._monitors_json:
+            return self._get_event_details_url(event_info.event_id)
+
+        query = self._config.frame_list_url.format(eventId=event_info.event_id, frameId=event_info.last_frame_id)
+        return query.replace(' ', '%20')
+
+    def _parse_frames(self, event_info: EventInfo,
+                      response: Optional[Response]) -> Optional[Tuple[Dict, List[Dict], Dict]]:
+        if not response:
+            return None
+
+        data = json.loads(response.content)
+        if 'frames' in data:
+            frames_json = [f['Frame'] for f in data['frames']]
+            return event_info.event_json, frames_json, self._monitors_json[event_info.monitor_id]
+
+        event_data = data['event']
+        self._monitors_json[event_info.monitor_id] = event_data['Monitor']
+        return event_data['Event'], event_data['Frame'], event_data['Monitor']
+
+    def _create_frames(self, event_info: EventInfo,
+                       details: Optional[Tuple[Dict, List[Dict], Dict]]) -> Optional[List[FrameInfo]]:
         if not details:
-            return ()
+            return None
 
         (event_json, frames_json, monitor_json) = details
 
         frames = []
         for frame_json in frames_json:
+            if frame_json['Type'] != 'Alarm' or int(frame_json['FrameId']) <= event_info.last_frame_id:
+                continue
+
             frame_id = frame_json['FrameId']
             file_name = self._get_frame_jpg_path(event_info.event_id, event_json, frame_id)
             frames.append(FrameInfo(frame_json, monitor_json, file_name, event_info))
@@ -105,6 +176,23 @@ class FrameReader:
         return file_name
 
 
+class EventCache(TTLCache):
+    def __init__(self, maxsize: int, ttl: float, on_evicted: Callable[[EventInfo], None]):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._on_evicted = on_evicted
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for (_, event_info) in expired:
+            self._on_evicted(event_info)
+        return expired
+
+    def popitem(self):
+        (event_id, event_info) = super().popitem()
+        self._on_evicted(event_info)
+        return event_id, event_info
+
+
 class FrameReaderWorker(Thread):
     log = logging.getLogger("events_processor.FrameReaderWorker")
 
@@ -113,20 +201,28 @@ class FrameReaderWorker(Thread):
                  config: ConfigProvider,
                  frame_queue: FrameQueue,
                  system_time: SystemTime,
-                 frame_reader: FrameReader):
+                 frame_reader: FrameReader,
+                 alarm_box_reader: AlarmBoxReader):
         super().__init__()
         self._config = config
         self._stop_requested = False
         self._system_time = system_time
+        self._alarm_box_reader = alarm_box_reader
 
         self._frame_queue = frame_queue
         event_ttl = config.events_window_seconds + config.cache_seconds_buffer
-        self._recent_events = TTLCache(maxsize=10000000, ttl=event_ttl)
+        self._recent_events = EventCache(maxsize=config.max_cached_events, ttl=event_ttl,
+                                         on_evicted=self._event_evicted)
+
+        self._max_event_id: Optional[int] = None
 
         self._frame_reader = frame_reader
         if config.event_ids:
             self._events_iter = lambda: self._frame_reader.events_by_id_iter(config.event_ids)
             self._skip_mailed = False
+        elif config.incremental_event_polling:
+            self._events_iter = lambda: self._frame_reader.events_iter(from_event_id=self._event_cursor())
+            self._skip_mailed = True
         else:
             self._events_iter = self._frame_reader.events_iter
             self._skip_mailed = True
@@ -134,7 +230,10 @@ class FrameReaderWorker(Thread):
     def run(self) -> None:
         while not self._stop_requested:
             before = time.monotonic()
-            self._collect_events()
+            try:
+                self._collect_events()
+            except Exception:
+                self.log.exception("Could not collect events")
             time_spent = (time.monotonic() - before)
             self._system_time.sleep(max(self._config.event_loop_seconds - time_spent, 0))
 
@@ -144,44 +243,103 @@ class FrameReaderWorker(Thread):
         self._stop_requested = True
 
     def _collect_events(self) -> None:
+        polled_events = self._poll_event_list()
+        for (event_info, frames) in zip(polled_events, self._frame_reader.frames_many(polled_events)):
+            self._collect_frames(event_info, frames)
+
+    def _poll_event_list(self) -> List[EventInfo]:
         self.log.info("Fetching event list")
 
+        polled_events = []
         for event_json in self._events_iter():
             event_id = event_json['Id']
             event_info = self._recent_events.setdefault(event_id, EventInfo())
             event_info.event_json = event_json
+            self._max_event_id = max(int(event_id), self._max_event_id or 0)
 
-            if event_info.all_frames_were_read or event_info.notification_status.was_sending:
+            if event_info.all_frames_were_read or event_info.notification_status.was_submitted:
                 continue
 
             if event_info.emailed and self._skip_mailed:
                 self.log.debug(f'Skipping processing of event {event_info} as it was already mailed')
                 continue
 
-            self._collect_frames(event_info)
+            polled_events.append(event_info)
 
-    def _collect_frames(self, event_info: EventInfo):
-        self.log.info(f"Reading event frames: {event_info}")
+        return polled_events
 
-        frames = self._frame_reader.frames(event_info)
-        if frames:
-            pending_frames = False
-            for frame_info in frames:
-                if frame_info.type != 'Alarm':
-                    continue
+    def _event_evicted(self, event_info: EventInfo) -> None:
+        cancelled_frames = self._frame_queue.cancel_event(event_info)
+        if cancelled_frames:
+            with event_info.lock:
+                event_info.processed_frame_ids.update(f.frame_id for f in cancelled_frames)
+            self.log.debug(f"Dropped {len(cancelled_frames)} pending frames of expired event: {event_info}")
+
+        with event_info.lock:
+            if not event_info.notification_status.was_submitted:
+                for frame_info in event_info.candidate_frames:
+                    frame_info.release_stored_image()
+
+    def _event_needs_polling(self, event_info: EventInfo) -> bool:
+        if event_info.all_frames_were_read or event_info.notification_status.was_submitted:
+            return False
+        return not (event_info.emailed and self._skip_mailed)
 
-                if frame_info.frame_id in event_info.retrieved_frame_ids:
-                    continue
+    def _event_cursor(self) -> Optional[int]:
+        if self._max_event_id is None or not self._recent_events:
+            return None
 
-                if self._frame_data_has_settled(frame_info):
-                    self._frame_queue.put(frame_info)
-                    event_info.retrieved_frame_ids.add(frame_info.frame_id)
-                else:
-                    pending_frames = True
+        polled_ids = [int(event_id) for (event_id, event_info) in self._recent_events.items()
+                      if self._event_needs_polling(event_info)]
+        return min(polled_ids, default=self._max_event_id + 1)
+
+    def _collect_frames(self, event_info: EventInfo, frames: Optional[List[FrameInfo]]):
+        self.log.info(f"Reading event frames: {event_info}")
+
+        if frames is not None:
+            (settled_frames, pending_frames) = self._split_settled_frames(event_info, frames)
+            self._enqueue_frames(event_info, settled_frames)
 
             if not pending_frames and event_info.end_time is not None:
                 event_info.all_frames_were_read = True
 
-    def _frame_data_has_settled(self, frame_info):
+    def _split_settled_frames(self, event_info: EventInfo,
+                              frames: List[FrameInfo]) -> Tuple[List[FrameInfo], List[FrameInfo]]:
+        with event_info.lock:
+            new_frames = [f for f in frames if f.frame_id not in event_info.retrieved_frame_ids]
+
+        settled_count = 0
+        while settled_count < len(new_frames) and self._frame_data_has_settled(new_frames[settled_count]):
+            settled_count += 1
+        return new_frames[:settled_count], new_frames[settled_count:]
+
+    def _enqueue_frames(self, event_info: EventInfo, frames: List[FrameInfo]) -> None:
+        if not frames:
+            return
+
+        self._prefetch_alarm_boxes(event_info, frames)
+        self._mark_retrieved(event_info, frames)
+        self._frame_queue.put_many(frames)
+
+    @staticmethod
+    def _mark_retrieved(event_info: EventInfo, frames: List[FrameInfo]) -> None:
+        with event_info.lock:
+            for frame_info in frames:
+                event_info.retrieved_frame_ids.add(frame_info.frame_id)
+                event_info.last_frame_id = int(frame_info.frame_id)
+
+    def _prefetch_alarm_boxes(self, event_info: EventInfo, frames: List[FrameInfo]) -> None:
+        frame_ids = [f.frame_id for f in frames if f.frame_id not in event_info.alarm_boxes]
+        if frame_ids:
+            alarm_boxes = self._alarm_box_reader.read_many(event_info.event_id, frame_ids,
+                                                           self._config.excluded_zone_prefix)
+            with event_info.lock:
+                event_info.alarm_boxes.update(alarm_boxes)
+
+    def _frame_data_has_settled(self, frame_info: FrameInfo) -> bool:
+        return self._frame_settle_seconds(frame_info) == 0
+
+    def _frame_settle_seconds(self, frame_info: FrameInfo) -> float:
         frame_timestamp = datetime.strptime(frame_info.timestamp, '%Y-%m-%d %H:%M:%S')
-        return datetime.now() >= frame_timestamp + timedelta(seconds=self._config.frame_read_delay_seconds)
+        settle_time = frame_timestamp + timedelta(seconds=self._config.frame_read_delay_seconds)
+        return max((settle_time - datetime.now()).total_seconds(), 0)
@@ -74,8 +74,7 @@ class DetectionRenderer:
         return b, g, r
 
     def draw_boxes(self, frame_info, rect_drawer):
-        if frame_info.alarm_box:
-            box = frame_info.alarm_box
+        for box in frame_info.alarm_boxes:
             rect_drawer(box, "blue")
 
         for (i, r) in enumerate(frame_info.chunk_rects):
@@ -4,8 +4,16 @@ from events_processor.models import Rect
 def bounding_box(points):
     left = right = top = bottom = None
     for pt in points:
-        left = min(left, pt.x) if left else pt.x
-        right = max(right, pt.x) if right else pt.x
-        top = min(top, pt.y) if top else pt.y
-        bottom = max(bottom, pt.y) if bottom else pt.y
+        left = min(left, pt.x) if left is not None else pt.x
+        right = max(right, pt.x) if right is not None else pt.x
+        top = min(top, pt.y) if top is not None else pt.y
+        bottom = max(bottom, pt.y) if bottom is not None else pt.y
     return Rect(left, top, right, bottom)
+
+
+def union_rect(*rects: Rect) -> Rect:
+    return bounding_box([pt for rect in rects for pt in rect.points])
+
+
+def rects_intersect(a: Rect, b: Rect) -> bool:
+    return a.left <= b.right and b.left <= a.right and a.top <= b.bottom and b.top <= a.bottom
@@ -0,0 +1,50 @@
+import logging
+from typing import List, Sequence
+
+import numpy as np
+from injector import inject
+
+from events_processor.configtools import ConfigProvider
+from events_processor.models import FrameInfo, Detection
+
+
+class DuplicateDetectionSuppressor:
+    log = logging.getLogger('events_processor.DuplicateDetectionSuppressor')
+
+    @inject
+    def __init__(self, config: ConfigProvider):
+        self._config = config
+
+    def suppress_duplicates(self, frame_info: FrameInfo) -> None:
+        detections = frame_info.detections
+        if len(detections) < 2:
+            return
+
+        kept = self._kept_indices(detections)
+        if len(kept) < len(detections):
+            self.log.debug(f"Suppressed {len(detections) - len(kept)} duplicate detections in {frame_info}")
+            frame_info.detections = [detections[i] for i in kept]
+
+    def _kept_indices(self, detections: Sequence[Detection]) -> List[int]:
+        boxes = np.array([d.rect.box_tuple for d in detections], dtype=float)
+        scores = np.array([d.score for d in detections], dtype=float)
+        labels = np.array([d.label_id for d in detections])
+        areas = (boxes[:, 2] - boxes[:, 0] + 1) * (boxes[:, 3] - boxes[:, 1] + 1)
+
+        order = np.argsort(-scores, kind='stable')
+        kept = []
+        while order.size > 0:
+            (best, rest) = (order[0], order[1:])
+            kept.append(int(best))
+
+            width = np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]) + 1
+            height = np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]) + 1
+            intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+            iou = intersection / (areas[best] + areas[rest] - intersection)
+            containment = intersection / np.minimum(areas[best], areas[rest])
+
+            duplicate = (labels[rest] == labels[best]) & ((iou >= self._config.nms_iou_threshold) |
+                                                          (containment >= self._config.containment_threshold))
+            order = rest[~duplicate]
+
+        return sorted(kept)
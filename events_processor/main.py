@@ -2,7 +2,7 @@ from argparse import ArgumentParser
 
 from injector import Injector
 
-from events_processor.bindings import AppBindingsModule, FSNotificationSenderOverride
+from events_processor.bindings import AppBindingsModule, FSNotificationSenderOverride, DBFrameReaderOverride
 from events_processor.configtools import ConfigProvider
 from events_processor.controller import MainController
 
@@ -13,6 +13,10 @@ def main():
         "--fs-notifier",
         help="write notification images to disk instead of mailing them",
         action="store_true")
+    argparser.add_argument(
+        "--db-event-source",
+        help="read events and frames directly from ZoneMinder database instead of its REST API",
+        action="store_true")
     argparser.add_argument(
         "--event-ids",
         help="analyze specific events instead of fetching recent ones. Specify comma separated list of event ids")
@@ -25,6 +29,8 @@ def main():
     modules = [AppBindingsModule]
     if args.fs_notifier:
         modules.append(FSNotificationSenderOverride)
+    if args.db_event_source:
+        modules.append(DBFrameReaderOverride)
 
     injector = Injector(modules, auto_bind=False)
     config = injector.get(ConfigProvider)
@@ -1,10 +1,33 @@
 import unittest
 
+from tests.batching import InferenceBatcherTestCase, InferenceBatcherFailureTestCase, EnginePoolTestCase, \
+    EngineDefaultsTestCase, CpuEngineTestCase
+from tests.caching import DetectionCacheTestCase
+from tests.dataaccess import QuerySupportTestCase, DBFrameReaderTestCase, AlarmBoxPrefetchTestCase
+from tests.suppression import DuplicateSuppressionTestCase
+from tests.chunking import ChunkingTestCase
 from tests.detection import DetectionTestCase
+from tests.memory import ImageBufferPoolTestCase
+from tests.preprocessing import PreprocessingTestCase
+from tests.scheduling import FramePriorityQueueTestCase
 
 if __name__ == '__main__':
     suite = unittest.TestSuite()
     suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(DetectionTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(ChunkingTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(FramePriorityQueueTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(PreprocessingTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(ImageBufferPoolTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(InferenceBatcherTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(InferenceBatcherFailureTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(EnginePoolTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(EngineDefaultsTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(CpuEngineTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(DetectionCacheTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(QuerySupportTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(DBFrameReaderTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(AlarmBoxPrefetchTestCase))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromTestCase(DuplicateSuppressionTestCase))
 
     runner = unittest.TextTestRunner()
     runner.run(suite)
@@ -0,0 +1,293 @@
+import time
+import unittest
+from threading import Thread, Event
+
+import numpy as np
+from PIL import Image
+from injector import Injector, Module, Binder, singleton
+
+from events_processor.batching import InferenceBatcher
+from events_processor.bindings import AppBindingsModule
+from events_processor.configtools import ConfigProvider
+from events_processor.cpuengine import TFLiteDetectionEngine, DetectionCandidate
+from events_processor.enginepool import EnginePool, EngineInstance, OverflowEngineInstance
+from events_processor.interfaces import Engine
+from tests.bindings import TestBindingsModule
+from tests.mocks import TestTensorEngine
+
+
+class BatchRecordingEngine(TestTensorEngine):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def detect_batch(self, tensors, threshold):
+        self.batches.append(len(tensors))
+        return [int(tensor[0, 0, 0]) for tensor in tensors]
+
+
+class BatchRecordingEngineModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(Engine, to=BatchRecordingEngine, scope=singleton)
+
+
+class SlowEngine(TestTensorEngine):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def detect_tensor(self, tensor, threshold):
+        self.calls += 1
+        time.sleep(0.1)
+        return int(tensor[0, 0, 0])
+
+    def get_pending_processing_seconds(self) -> float:
+        return self.calls * 100
+
+
+class SlowEngineModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(EngineInstance, to=SlowEngine)
+        binder.bind(OverflowEngineInstance, to=SlowEngine)
+
+
+class FakeInterpreter:
+    def __init__(self):
+        self.input = None
+        self.outputs = {
+            1: np.array([[[0.1, 0.2, 0.5, 0.6], [0.0, 0.0, 1.0, 1.0]]]),
+            2: np.array([[0, 3]]),
+            3: np.array([[0.9, 0.2]]),
+            4: np.array([2.0]),
+        }
+
+    def allocate_tensors(self):
+        pass
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array([1, 300, 300, 3])}]
+
+    def get_output_details(self):
+        return [{'index': i} for i in range(1, 5)]
+
+    def set_tensor(self, index, tensor):
+        self.input = tensor
+
+    def invoke(self):
+        pass
+
+    def get_tensor(self, index):
+        return self.outputs[index]
+
+
+class FakeInterpreterEngine(TFLiteDetectionEngine):
+    @staticmethod
+    def _create_interpreter(model_file, num_threads):
+        return FakeInterpreter()
+
+
+class BlockingEngine(BatchRecordingEngine):
+    def __init__(self):
+        super().__init__()
+        self.started = Event()
+        self.release = Event()
+
+    def detect_batch(self, tensors, threshold):
+        self.started.set()
+        self.release.wait(timeout=5)
+        if int(tensors[0][0, 0, 0]) == 0:
+            raise ValueError("engine failure")
+        return super().detect_batch(tensors, threshold)
+
+
+class BlockingEngineModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(Engine, to=BlockingEngine, scope=singleton)
+
+
+class InferenceBatcherTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        injector = Injector([AppBindingsModule, TestBindingsModule, BatchRecordingEngineModule], auto_bind=False)
+        self._config = injector.get(ConfigProvider)
+        self._config['coral'].update({'batch_size': '4', 'batch_timeout_ms': '2000'})
+        self._config.reread()
+
+        self._engine = injector.get(Engine)
+        self._batcher = injector.get(InferenceBatcher)
+        self._batcher.daemon = True
+        self._batcher.start()
+
+    def tearDown(self) -> None:
+        self._batcher.stop()
+
+    @staticmethod
+    def _tensor(value):
+        return np.full((2, 2, 3), value, np.uint8)
+
+    def test_requests_from_several_threads_are_batched_and_routed_back(self):
+        results = {}
+
+        def submit(name, values):
+            results[name] = self._batcher.detect_batch([self._tensor(v) for v in values], 0.5)
+
+        threads = [Thread(target=submit, args=('a', (1, 2))), Thread(target=submit, args=('b', (3, 4)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual(results, {'a': [1, 2], 'b': [3, 4]})
+        self.assertEqual(self._engine.batches, [4])
+
+    def test_partial_batch_dispatched_after_timeout(self):
+        self._config['coral']['batch_timeout_ms'] = '10'
+        self._config.reread()
+
+        self.assertEqual(self._batcher.detect_batch([self._tensor(7)], 0.5), [7])
+        self.assertEqual(self._engine.batches, [1])
+
+
+class InferenceBatcherFailureTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        injector = Injector([AppBindingsModule, TestBindingsModule, BlockingEngineModule], auto_bind=False)
+        config = injector.get(ConfigProvider)
+        config['coral'].update({'batch_size': '4', 'batch_timeout_ms': '1'})
+        config.reread()
+
+        self._engine = injector.get(Engine)
+        self._batcher = injector.get(InferenceBatcher)
+        self._batcher.daemon = True
+        self._batcher.start()
+
+    def tearDown(self) -> None:
+        self._engine.release.set()
+        self._batcher.stop()
+
+    def _submit_in_background(self, value):
+        outcome = {}
+
+        def submit():
+            try:
+                outcome['result'] = self._batcher.detect_batch([np.full((2, 2, 3), value, np.uint8)], 0.5)
+            except Exception as e:
+                outcome['error'] = e
+
+        thread = Thread(target=submit)
+        thread.start()
+        return thread, outcome
+
+    def test_engine_error_raised_to_caller(self):
+        self._engine.release.set()
+        with self.assertRaises(ValueError):
+            self._batcher.detect_batch([np.zeros((2, 2, 3), np.uint8)], 0.5)
+
+    def test_caller_times_out_when_no_result_arrives(self):
+        self._batcher.result_timeout_seconds = 0.1
+        with self.assertRaises(TimeoutError):
+            self._batcher.detect_batch([np.ones((2, 2, 3), np.uint8)], 0.5)
+
+    def test_pending_requests_fail_when_batcher_stops(self):
+        (first, _) = self._submit_in_background(1)
+        self.assertTrue(self._engine.started.wait(timeout=5))
+        (pending, outcome) = self._submit_in_background(2)
+        time.sleep(0.1)
+
+        self._batcher.stop()
+        self._engine.release.set()
+        first.join(timeout=5)
+        pending.join(timeout=5)
+
+        self.assertIsInstance(outcome.get('error'), RuntimeError)
+
+
+class EnginePoolTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._injector = Injector([AppBindingsModule, TestBindingsModule, SlowEngineModule], auto_bind=False)
+        self._config = self._injector.get(ConfigProvider)
+        self._config['coral']['engine_count'] = '2'
+        self._config.reread()
+
+        self._pool = self._injector.create_object(EnginePool)
+
+    @staticmethod
+    def _tensor(value):
+        return np.full((2, 2, 3), value, np.uint8)
+
+    def test_concurrent_calls_dispatched_to_least_loaded_engines(self):
+        threads = [Thread(target=self._pool.detect_tensor, args=(self._tensor(i), 0.5)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual([m['calls'] for m in self._pool.metrics()], [1, 1])
+        self.assertTrue(all(m['busy_seconds'] > 0 for m in self._pool.metrics()))
+
+    def test_batch_split_across_engines_keeps_order(self):
+        results = self._pool.detect_batch([self._tensor(i) for i in range(5)], 0.5)
+
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        self.assertEqual([m['calls'] for m in self._pool.metrics()], [1, 1])
+
+    def test_overflow_engine_used_when_primary_backs_up(self):
+        self._config['coral'].update({'engine_count': '1', 'overflow_engine_count': '1', 'overflow_queue_depth': '1'})
+        self._config.reread()
+        pool = self._injector.create_object(EnginePool)
+
+        threads = [Thread(target=pool.detect_tensor, args=(self._tensor(i), 0.5)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual([(m['overflow'], m['calls']) for m in pool.metrics()], [(False, 1), (True, 1)])
+
+    def test_pending_processing_seconds_reported_per_instance(self):
+        self._pool.detect_tensor(self._tensor(0), 0.5)
+
+        self.assertEqual(sorted(self._pool.get_pending_processing_seconds_per_instance()), [0, 100])
+        self.assertEqual(self._pool.get_pending_processing_seconds(), 100)
+
+
+class ImageOnlyEngine(Engine):
+    def __init__(self):
+        self.images = []
+
+    def detect(self, img, threshold):
+        self.images.append(img)
+        return [DetectionCandidate(np.array([[30.0, 60.0], [150.0, 300.0]]), 0.9, 1)]
+
+    def get_pending_processing_seconds(self) -> float:
+        return 0
+
+
+class EngineDefaultsTestCase(unittest.TestCase):
+
+    def test_tensor_detection_defaults_to_image_detection_with_relative_boxes(self):
+        engine = ImageOnlyEngine()
+        (candidates,) = engine.detect_batch([np.zeros((300, 300, 3), np.uint8)], 0.5)
+
+        self.assertIsInstance(engine.images[0], Image.Image)
+        np.testing.assert_allclose(candidates[0].bounding_box, [[0.1, 0.2], [0.5, 1.0]])
+
+
+class CpuEngineTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        injector = Injector([AppBindingsModule, TestBindingsModule], auto_bind=False)
+        self._engine = injector.create_object(FakeInterpreterEngine)
+
+    def test_candidates_follow_edgetpu_relative_box_layout(self):
+        candidates = self._engine.detect_tensor(np.zeros((300, 300, 3), np.uint8), 0.5)
+
+        self.assertEqual(self._engine.input_shape(), (300, 300))
+        self.assertEqual(len(candidates), 1)
+        self.assertEqual(candidates[0].label_id, 0)
+        np.testing.assert_allclose(candidates[0].bounding_box, [[0.2, 0.1], [0.6, 0.5]])
+
+    def test_image_detection_returns_absolute_coordinates(self):
+        candidates = self._engine.detect(np.zeros((600, 600, 3), np.uint8), 0.5)
+        np.testing.assert_allclose(candidates[0].bounding_box, [[120, 60], [360, 300]])
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from injector import Injector, Module, Binder, singleton
+
+from events_processor.bindings import AppBindingsModule
+from events_processor.configtools import ConfigProvider
+from events_processor.detectioncache import CachingDetectionEngine, CachedEngine
+from tests.bindings import TestBindingsModule
+from tests.mocks import TestTensorEngine, TestCandidate
+
+
+class CountingTensorEngine(TestTensorEngine):
+    def detect_batch(self, tensors, threshold):
+        self.tensors.extend(tensors)
+        return [[TestCandidate([[0.1, 0.1], [0.2, 0.2]], score=float(tensor[0, 0, 0]) / 255)] for tensor in tensors]
+
+
+class CountingEngineModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(CachedEngine, to=CountingTensorEngine, scope=singleton)
+
+
+class DetectionCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._injector = Injector([AppBindingsModule, TestBindingsModule, CountingEngineModule], auto_bind=False)
+        self._config = self._injector.get(ConfigProvider)
+        self._engine = self._injector.get(CachedEngine)
+
+    def _tensor(self, value):
+        return np.full((300, 300, 3), value, np.uint8)
+
+    def _cache(self, **properties) -> CachingDetectionEngine:
+        self._config['detection_cache'].update(properties)
+        self._config.reread()
+        return self._injector.create_object(CachingDetectionEngine)
+
+    def test_identical_pixels_skip_engine(self):
+        cache = self._cache(memory_entries='16')
+
+        first = cache.detect_batch([self._tensor(10), self._tensor(20)], 0.5)
+        second = cache.detect_batch([self._tensor(20), self._tensor(30), self._tensor(10)], 0.5)
+
+        self.assertEqual(len(self._engine.tensors), 3)
+        self.assertEqual([c[0].score for c in second], [20 / 255, 30 / 255, 10 / 255])
+        self.assertEqual(first[0][0].score, second[2][0].score)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+    def test_threshold_is_part_of_key(self):
+        cache = self._cache(memory_entries='16')
+
+        cache.detect_tensor(self._tensor(10), 0.5)
+        cache.detect_tensor(self._tensor(10), 0.6)
+
+        self.assertEqual(len(self._engine.tensors), 2)
+
+    def test_returned_candidates_are_not_shared_with_cache(self):
+        cache = self._cache(memory_entries='16')
+
+        cache.detect_tensor(self._tensor(10), 0.5)[0].bounding_box *= 100
+        self.assertAlmostEqual(cache.detect_tensor(self._tensor(10), 0.5)[0].bounding_box[1][1], 0.2)
+
+    def test_disk_tier_survives_restart_and_evicts_over_budget(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = self._cache(memory_entries='0', disk_dir=cache_dir, disk_mb='1')
+            cache.detect_tensor(self._tensor(10), 0.5)
+
+            restarted = self._injector.create_object(CachingDetectionEngine)
+            restarted.detect_tensor(self._tensor(10), 0.5)
+            self.assertEqual(len(self._engine.tensors), 1)
+
+            entry_size = os.path.getsize(os.path.join(cache_dir, os.listdir(cache_dir)[0]))
+            self._config['detection_cache']['disk_mb'] = str(entry_size * 2.5 / 1024 / 1024)
+            self._config.reread()
+            for value in range(20, 25):
+                restarted.detect_tensor(self._tensor(value), 0.5)
+
+            self.assertLessEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_disk_entries_are_plain_arrays_and_overwrites_are_accounted_once(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = self._cache(memory_entries='0', disk_dir=cache_dir)
+            for _ in range(3):
+                cache._store(cache._key(self._tensor(10), 0.5, 'tensor'), [TestCandidate([[0.1, 0.1], [0.2, 0.2]])])
+
+            (entry,) = os.listdir(cache_dir)
+            self.assertTrue(entry.endswith('.npz'))
+            np.load(os.path.join(cache_dir, entry), allow_pickle=False)['boxes']
+            self.assertEqual(cache._disk_bytes, os.path.getsize(os.path.join(cache_dir, entry)))
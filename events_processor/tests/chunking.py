@@ -0,0 +1,164 @@
+import unittest
+
+import numpy as np
+from injector import Injector, Module, Binder, singleton
+
+from events_processor.bindings import AppBindingsModule
+from events_processor.configtools import ConfigProvider
+from events_processor.detector import CoralDetector
+from events_processor.interfaces import Engine, AlarmBoxReader
+from events_processor.models import Rect, Point
+from events_processor.processor import FrameImageLoader
+from tests.bindings import TestBindingsModule
+from tests.mocks import TestRecordingEngine, TestTensorEngine, TestCandidate, frame_info_for
+
+
+class RecordingEngineModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(Engine, to=TestRecordingEngine, scope=singleton)
+
+
+class TensorEngineModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(Engine, to=TestTensorEngine, scope=singleton)
+
+
+class ChunkingTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        injector = Injector([AppBindingsModule, TestBindingsModule, RecordingEngineModule], auto_bind=False)
+        self._config = injector.get(ConfigProvider)
+        self._engine = injector.get(Engine)
+        self._alarm_box_reader = injector.get(AlarmBoxReader)
+        self._detector = injector.create_object(CoralDetector)
+        self._image_loader = injector.get(FrameImageLoader)
+
+    def _detect(self, boxes=(), config_updates=None):
+        self._alarm_box_reader.boxes = list(boxes)
+        if config_updates:
+            for (key, value) in config_updates.items():
+                self._config[key].update(value)
+            self._config.reread()
+
+        frame_info = self._frame_info()
+        self._detector.detect(frame_info)
+        return frame_info
+
+    def _frame_info(self, image=None, image_scale=1):
+        image = image if image is not None else np.zeros((1000, 1000, 3), np.uint8)
+        return frame_info_for(image=image, image_scale=image_scale)
+
+    def test_separate_motion_regions_are_chunked_separately(self):
+        frame_info = self._detect(boxes=(Rect(10, 10, 60, 60), Rect(800, 800, 850, 850)))
+        self.assertEqual(len(frame_info.chunk_rects), 2)
+        self.assertEqual(len(self._engine.images), 2)
+        self.assertTrue(all(r.width == 300 and r.height == 300 for r in frame_info.chunk_rects))
+
+    def test_overlapping_motion_regions_are_merged(self):
+        frame_info = self._detect(boxes=(Rect(10, 10, 60, 60), Rect(100, 100, 150, 150)))
+        self.assertEqual(len(frame_info.chunk_rects), 1)
+
+    def test_regions_overlapping_only_after_merge_are_merged(self):
+        frame_info = self._detect(boxes=(Rect(400, 200, 450, 220), Rect(0, 600, 250, 650), Rect(300, 600, 550, 650)))
+        self.assertEqual(len(frame_info.chunk_rects), 1)
+
+    def test_no_motion_region_chunks_whole_frame(self):
+        frame_info = self._detect(config_updates={'coral': {'detection_chunks': '2x2'}})
+        self.assertEqual(len(frame_info.chunk_rects), 5)
+
+    def test_auto_decode_reduction_keeps_grid_chunks_above_model_input(self):
+        frame_info = self._detect(config_updates={'coral': {'decode_reduction': 'auto', 'detection_chunks': '1x1'}})
+        self.assertEqual(self._detector.decode_reduction(frame_info), 2)
+
+    def test_reduced_image_detections_in_full_resolution(self):
+        self._alarm_box_reader.boxes = [Rect(800, 800, 850, 850)]
+        frame_info = self._frame_info(image=np.zeros((500, 500, 3), np.uint8), image_scale=2)
+        self._detector.detect(frame_info)
+        self.assertEqual(frame_info.chunk_rects[0].width, 599)
+        self.assertEqual(frame_info.chunk_rects[0].bottom, 998)
+
+    def test_roi_decode_reads_only_chunked_area(self):
+        self._detect(boxes=(Rect(800, 800, 850, 850),), config_updates={'coral': {'roi_decode': 'yes'}})
+        frame_info = self._frame_info()
+        roi = self._detector.decode_roi(frame_info, 1)
+        self._image_loader.load(frame_info, 1, roi)
+        self.assertEqual(frame_info.image.shape[:2], (300, 300))
+        self.assertEqual(frame_info.image_origin, Point(675, 675))
+
+        self._detector.detect(frame_info)
+        self.assertEqual(frame_info.chunk_rects, [roi])
+        self.assertFalse(frame_info.image_is_full_frame)
+
+    def test_roi_decode_skipped_for_large_motion_area(self):
+        self._detect(boxes=(Rect(0, 0, 900, 900),), config_updates={'coral': {'roi_decode': 'yes'}})
+        self.assertIsNone(self._detector.decode_roi(self._frame_info(), 1))
+
+    def test_tensor_engine_gets_resized_chunk_and_relative_boxes_are_mapped_back(self):
+        injector = Injector([AppBindingsModule, TestBindingsModule, TensorEngineModule], auto_bind=False)
+        engine = injector.get(Engine)
+        engine.candidates = [TestCandidate([[0.5, 0.0], [1.0, 0.5]])]
+        injector.get(AlarmBoxReader).boxes = [Rect(0, 0, 599, 299)]
+        detector = injector.create_object(CoralDetector)
+
+        image = np.zeros((1000, 1000, 3), np.uint8)
+        image[:300, :600] = 200
+        frame_info = self._frame_info(image=image)
+        detector.detect(frame_info)
+
+        tensor = engine.tensors[0]
+        self.assertEqual(tensor.shape, (300, 300, 3))
+        self.assertTrue((tensor[:149] == 200).all())
+        self.assertTrue((tensor[151:] == 0).all())
+        self.assertEqual(frame_info.detections[0].rect, Rect(299, 0, 599, 299))
+
+    def test_near_identical_frame_reuses_detections_of_last_inferred_frame(self):
+        self._alarm_box_reader.boxes = [Rect(100, 100, 200, 200)]
+        self._config['coral'].update({'reuse_max_change': '0.02'})
+        self._config.reread()
+        self._engine.detect = lambda img, threshold: self._engine.images.append(img) or [
+            TestCandidate([[10, 10], [50, 50]])]
+
+        image = np.full((1000, 1000, 3), 100, np.uint8)
+        first = self._frame_info(image=image)
+        self._detector.detect(first)
+
+        similar_image = image.copy()
+        similar_image[150:152, 150:152] = 255
+        similar = self._frame_info(image=similar_image)
+        similar.event_info = first.event_info
+        self._detector.detect(similar)
+
+        self.assertEqual(len(self._engine.images), 1)
+        self.assertEqual([d.rect for d in similar.detections], [d.rect for d in first.detections])
+        self.assertIsNot(similar.detections[0], first.detections[0])
+
+        changed_image = image.copy()
+        changed_image[100:250, 100:250] = 0
+        changed = self._frame_info(image=changed_image)
+        changed.event_info = first.event_info
+        self._detector.detect(changed)
+
+        self.assertEqual(len(self._engine.images), 2)
+
+    def test_cost_planner_uses_fewest_overlapping_chunks_keeping_objects_detectable(self):
+        frame_info = self._detect(config_updates={'coral': {'min_object_size': '60'}})
+        self.assertEqual(len(frame_info.chunk_rects), 5)
+        self.assertEqual(self._detector.expected_inferences(frame_info), 5)
+        self.assertEqual(frame_info.chunk_rects[1].left, frame_info.chunk_rects[0].right + 1 - 60)
+
+    def test_cost_planner_skips_overview_when_objects_fit_in_chunk(self):
+        frame_info = self._detect(config_updates={'coral': {'min_object_size': '60', 'max_object_size': '400'}})
+        self.assertEqual(len(frame_info.chunk_rects), 4)
+
+    def test_cost_planner_keeps_overview_when_objects_exceed_actual_chunk_size(self):
+        frame_info = self._detect(config_updates={'coral': {'min_object_size': '60', 'max_object_size': '800'}})
+        self.assertEqual(len(frame_info.chunk_rects), 5)
+        self.assertTrue(all(rect.width < 800 for rect in frame_info.chunk_rects[:4]))
+
+    def test_cost_planner_uses_single_inference_for_large_objects(self):
+        frame_info = self._detect(config_updates={'coral': {'min_object_size': '200'}})
+        self.assertEqual(len(frame_info.chunk_rects), 1)
+
+    def test_configured_grid_takes_precedence_over_cost_planner(self):
+        frame_info = self._detect(config_updates={'coral': {'min_object_size': '200', 'detection_chunks1': '2x2'}})
+        self.assertEqual(len(frame_info.chunk_rects), 5)
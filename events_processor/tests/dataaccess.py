@@ -0,0 +1,221 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+from injector import Injector, Module, Binder, singleton
+from mysql.connector import OperationalError
+
+from events_processor.bindings import AppBindingsModule
+from events_processor.dataaccess import ConnectionPool, QuerySupport, DBFrameReader, DBAlarmBoxReader
+from events_processor.detector import CoralDetector
+from events_processor.interfaces import AlarmBoxReader, Engine
+from events_processor.models import Rect
+from events_processor.reader import FrameReaderWorker
+from tests.bindings import TestBindingsModule
+from tests.mocks import TestAlarmBoxReader, TestRecordingEngine, frame_info_for, event_info_for
+
+
+class FakeCursor:
+    def __init__(self, results):
+        self._results = list(results)
+        self._rows = []
+        self.description = None
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        (columns, self._rows) = self._results.pop(0)
+        self.description = [(column,) for column in columns]
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor=None, error=None, ping_error=None):
+        self._cursor = cursor
+        self._error = error
+        self._ping_error = ping_error
+        self.reconnects = 0
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        if self._ping_error:
+            raise self._ping_error
+
+    def reconnect(self, attempts=1, delay=0):
+        self.reconnects += 1
+
+    def cursor(self):
+        if self._error:
+            raise self._error
+        return self._cursor
+
+    def close(self):
+        self.closed = True
+
+
+class FakeMySQLPool:
+    def __init__(self, connections):
+        self.connections = list(connections)
+
+    def get_connection(self):
+        return self.connections.pop(0)
+
+
+class FakeConnectionPool(ConnectionPool):
+    def __init__(self):
+        super().__init__()
+        self.mysql_pool = FakeMySQLPool([])
+
+    def _get_pool(self):
+        return self.mysql_pool
+
+    def returning(self, *results):
+        self.mysql_pool.connections.append(FakeConnection(FakeCursor(results)))
+        return self
+
+
+class FakeConnectionPoolModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(ConnectionPool, to=FakeConnectionPool, scope=singleton)
+
+
+class CountingAlarmBoxReader(TestAlarmBoxReader):
+    def __init__(self):
+        super().__init__()
+        self.read_calls = 0
+        self.read_many_calls = 0
+
+    def read(self, event_id, frame_id, excl_zone_prefix):
+        self.read_calls += 1
+        return super().read(event_id, frame_id, excl_zone_prefix)
+
+    def read_many(self, event_id, frame_ids, excl_zone_prefix):
+        self.read_many_calls += 1
+        return {frame_id: [Rect(100, 100, 200, 200)] for frame_id in frame_ids}
+
+
+class CountingModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(AlarmBoxReader, to=CountingAlarmBoxReader, scope=singleton)
+        binder.bind(Engine, to=TestRecordingEngine, scope=singleton)
+
+
+def _event(event_id, monitor_id):
+    return event_info_for(event_id=event_id, monitor_id=monitor_id, StartTime='2020-01-01 10:00:00')
+
+
+class QuerySupportTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._pool = FakeConnectionPool()
+        self._query_support = QuerySupport(self._pool)
+
+    def _query(self, cursor):
+        cursor.execute("select 1")
+        return cursor.fetchall()
+
+    def test_connection_error_retried_on_new_connection(self):
+        failing = FakeConnection(error=OperationalError("gone away"))
+        self._pool.mysql_pool.connections.append(failing)
+        self._pool.returning((['x'], [(1,)]))
+
+        self.assertEqual(self._query_support.invoke_query(self._query), [(1,)])
+        self.assertEqual(self._pool.metrics()['failures'], 1)
+        self.assertEqual(self._pool.metrics()['checkouts'], 2)
+
+    def test_exhausted_retries_raise_to_caller(self):
+        self._pool.mysql_pool.connections += [FakeConnection(error=OperationalError("gone away")) for _ in range(2)]
+
+        with self.assertRaises(OperationalError):
+            self._query_support.invoke_query(self._query)
+        self.assertEqual(self._pool.metrics()['failures'], 2)
+
+    def test_connection_returned_to_pool_after_failure(self):
+        failing = FakeConnection(error=OperationalError("gone away"))
+        self._pool.mysql_pool.connections.append(failing)
+
+        with self.assertRaises(OperationalError):
+            self._query_support.invoke_query(self._query, attempts=1)
+
+        self.assertTrue(failing.closed)
+        self.assertEqual(self._pool.metrics()['in_use'], 0)
+        for _ in range(self._pool._db_config['pool_size'] + 1):
+            self._pool.returning((['x'], [(1,)]))
+            self.assertEqual(self._query_support.invoke_query(self._query), [(1,)])
+
+    def test_stale_connection_reconnected(self):
+        stale = FakeConnection(FakeCursor([(['x'], [(1,)])]), ping_error=OperationalError("stale"))
+        self._pool.mysql_pool.connections.append(stale)
+
+        self.assertEqual(self._query_support.invoke_query(self._query), [(1,)])
+        self.assertEqual(stale.reconnects, 1)
+        self.assertEqual(self._pool.metrics()['reconnects'], 1)
+
+
+class DBFrameReaderTestCase(unittest.TestCase):
+    _FRAME_COLUMNS = ['Id', 'EventId', 'FrameId', 'Type', 'TimeStamp', 'Delta', 'Score']
+    _MONITOR_COLUMNS = ['Id', 'Name', 'Width', 'Height']
+
+    def setUp(self) -> None:
+        injector = Injector([AppBindingsModule, TestBindingsModule, FakeConnectionPoolModule], auto_bind=False)
+        self._pool = injector.get(ConnectionPool)
+        self._reader = injector.create_object(DBFrameReader)
+        self._alarm_box_reader = injector.create_object(DBAlarmBoxReader)
+
+    def _frame_row(self, row_id, event_id, frame_id):
+        return row_id, event_id, frame_id, 'Alarm', datetime(2020, 1, 1, 10, 0, frame_id), 0.1, 10
+
+    def test_rows_grouped_per_event_skipping_event_with_missing_monitor(self):
+        events = [_event('1', '1'), _event('2', '2')]
+        self._pool.returning(
+            (self._FRAME_COLUMNS, [self._frame_row(1, 1, 1), self._frame_row(2, 1, 2), self._frame_row(3, 2, 5)]),
+            ([], [(1, 1, 10, 10, 20, 20), (1, 1, 30, 30, 40, 40), (2, 5, 0, 0, 5, 5)]),
+            (self._MONITOR_COLUMNS, [(1, 'SomeMonitor', 1000, 1000)]))
+
+        (first, second) = self._reader.frames_many(events)
+
+        self.assertEqual([f.frame_id for f in first], ['1', '2'])
+        self.assertIsNone(second)
+        self.assertEqual(first[0].monitor_json['Name'], 'SomeMonitor')
+        self.assertEqual(str(first[0]), '(m: SomeMonitor, eid: 1, fid: 1)')
+        self.assertEqual(events[0].alarm_boxes['1'], [Rect(10, 10, 20, 20), Rect(30, 30, 40, 40)])
+        self.assertEqual(events[1].alarm_boxes, {})
+
+    def test_empty_result_gives_no_frames(self):
+        self._pool.returning((self._FRAME_COLUMNS, []), ([], []),
+                             (self._MONITOR_COLUMNS, [(1, 'SomeMonitor', 1000, 1000)]))
+        self.assertEqual(self._reader.frames_many([_event('1', '1')]), [[]])
+        self.assertEqual(self._reader.frames_many([]), [])
+
+    def test_alarm_boxes_of_frame_batch_read_in_single_query(self):
+        self._pool.returning(([], [(1, 10, 10, 20, 20), (3, 0, 0, 5, 5)]))
+        cursor = self._pool.mysql_pool.connections[0]._cursor
+
+        boxes = self._alarm_box_reader.read_many('1', ['1', '2', '3'], 'excl_')
+
+        self.assertEqual(len(cursor.executed), 1)
+        self.assertEqual(boxes, {'1': [Rect(10, 10, 20, 20)], '2': [], '3': [Rect(0, 0, 5, 5)]})
+
+
+class AlarmBoxPrefetchTestCase(unittest.TestCase):
+
+    def test_detector_uses_boxes_prefetched_in_one_call_per_batch(self):
+        injector = Injector([AppBindingsModule, TestBindingsModule, CountingModule], auto_bind=False)
+        alarm_box_reader = injector.get(AlarmBoxReader)
+        worker = injector.create_object(FrameReaderWorker)
+        detector = injector.create_object(CoralDetector)
+
+        event_info = _event('1', '1')
+        frames = [frame_info_for(event_info, str(i), image=np.zeros((1000, 1000, 3), np.uint8)) for i in range(3)]
+        worker._enqueue_frames(event_info, frames)
+        for frame_info in frames:
+            detector.detect(frame_info)
+
+        self.assertEqual(alarm_box_reader.read_many_calls, 1)
+        self.assertEqual(alarm_box_reader.read_calls, 0)
+        self.assertEqual(frames[0].alarm_boxes, [Rect(100, 100, 200, 200)])
@@ -1,14 +1,51 @@
+import asyncio
 import unittest
 
 import numpy as np
-from injector import Injector
+from injector import Injector, Module, Binder, singleton, inject
 
+from events_processor.asyncreader import AsyncFrameReaderWorker
 from events_processor.bindings import AppBindingsModule
-from events_processor.models import Rect, ZoneInfo
+from events_processor.configtools import ConfigProvider
+from events_processor.interfaces import ImageReader, NotificationSender, ResourceReader
+from events_processor.models import Rect, ZoneInfo, NotificationStatus, Detection
+from events_processor.notifications import NotificationWorker
+from events_processor.reader import FrameReader
 from tests.bindings import TestBindingsModule
+from tests.mocks import TestImageReader, event_info_for, frame_info_for
 from tests.pipeline import TestDetection, ResourceTemplate, Pipeline
 
 
+class UnreadableFrameImageReader(TestImageReader):
+    def read(self, file_name, reduction=1, dst=None):
+        return None if file_name.endswith('00001-capture.jpg') else super().read(file_name, reduction, dst)
+
+    def read_encoded(self, file_name):
+        return None
+
+
+class UnreadableFrameModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(ImageReader, to=UnreadableFrameImageReader, scope=singleton)
+
+
+class BatchRecordingFrameReader(FrameReader):
+    @inject
+    def __init__(self, resource_reader: ResourceReader, config: ConfigProvider):
+        super().__init__(resource_reader, config)
+        self.batches = []
+
+    def frames_many(self, event_infos):
+        event_infos = list(event_infos)
+        self.batches.append([e.event_id for e in event_infos])
+        return super().frames_many(event_infos)
+
+
+class BatchRecordingFrameReaderModule(Module):
+    def configure(self, binder: Binder) -> None:
+        binder.bind(FrameReader, to=BatchRecordingFrameReader, scope=singleton)
+
+
 class DetectionTestCase(unittest.TestCase):
 
     def setUp(self) -> None:
@@ -59,6 +96,121 @@ class DetectionTestCase(unittest.TestCase):
         )
         self.assertAlmostEqual(len(notifications), 0)
 
+    def _test_inference_budget(self, detected_frame_id):
+        notifications = self._pipeline.run_with(
+            detections={
+                detected_frame_id: [TestDetection(score=0.8)],
+            },
+            frames=[
+                ResourceTemplate.frame_template(frames=3, scores=[10, 30, 20]),
+            ],
+            config_updates={
+                'coral': {'max_inferred_frames': '1'}
+            }
+        )
+        return notifications
+
+    def test_inference_budget_spent_on_highest_motion_score_frame(self):
+        notifications = self._test_inference_budget(detected_frame_id='1')
+        self.assertEqual(len(notifications), 1)
+
+    def test_inference_budget_exhausted(self):
+        notifications = self._test_inference_budget(detected_frame_id='0')
+        self.assertEqual(len(notifications), 0)
+
+    def test_inference_budget_not_spent_on_unreadable_frame(self):
+        injector = Injector([AppBindingsModule, TestBindingsModule, UnreadableFrameModule], auto_bind=False)
+        config = injector.get(ConfigProvider)
+        config['threading']['decode_threads'] = '1'
+        config.reread()
+
+        notifications = injector.create_object(Pipeline).run_with(
+            detections={'2': [TestDetection(score=0.8)]},
+            frames=[ResourceTemplate.frame_template(frames=3, scores=[10, 30, 20])],
+            config_updates={'coral': {'max_inferred_frames': '1'}}
+        )
+        self.assertEqual(len(notifications), 1)
+
+    def test_notification_sent_without_image_when_frame_unreadable(self):
+        injector = Injector([AppBindingsModule, TestBindingsModule, UnreadableFrameModule], auto_bind=False)
+        worker = injector.create_object(NotificationWorker)
+        event_info = event_info_for(**ResourceTemplate.event_template()['events'][0]['Event'])
+        frame_info = frame_info_for(event_info, image_path='events/00001-capture.jpg', score=0.8,
+                                    detections=[Detection(Rect(10, 10, 50, 50), 0.8, 0, 'person',
+                                                          detection_area_percent=1.0)])
+        frame_info.frame_json.update({'TimeStamp': '2020-01-01 00:00:00', 'Type': 'Alarm'})
+        event_info.candidate_frames.append(frame_info)
+        worker._notifications.add(event_info)
+        rendered = []
+        worker._detection_renderer.annotate_image = rendered.append
+
+        worker._send_notification(event_info)
+
+        notifications = injector.get(NotificationSender).notifications
+        self.assertEqual(len(notifications), 1)
+        self.assertIsNone(notifications[0].frame_info.image)
+        self.assertEqual(rendered, [])
+        self.assertEqual(event_info.notification_status, NotificationStatus.SENT)
+
+    def test_incremental_polling_continues_from_open_event(self):
+        self._pipeline.run_with(
+            detections={
+                '9': [TestDetection(score=0.8)],
+            },
+            events=[
+                ResourceTemplate.event_template(end_time=None),
+                ResourceTemplate.event_template(),
+            ],
+            frames=[
+                ResourceTemplate.frame_template(end_time=None, frames=3),
+                ResourceTemplate.frame_template(frames=3),
+            ],
+            config_updates={
+                'zm': {'incremental_event_polling': 'yes'}
+            }
+        )
+        list_urls = [url for url in self._pipeline.requested_urls if url.find('/api/events/index') != -1]
+        self.assertIn('StartTime', list_urls[0])
+        self.assertIn('Id%20>=:1.json', list_urls[1])
+
+        frame_urls = [url for url in self._pipeline.requested_urls if url.find('/api/frames/index') != -1]
+        self.assertIn('FrameId%20>:2.json', frame_urls[0])
+
+    def test_asyncio_ingestion_engine(self):
+        injector = Injector([AppBindingsModule, TestBindingsModule], auto_bind=False)
+        config = injector.get(ConfigProvider)
+        config['threading']['ingestion_engine'] = 'asyncio'
+        config.reread()
+
+        notifications = injector.create_object(Pipeline).run_with(score=0.7)
+        self.assertAlmostEqual(notifications[0].frame_info.score, 0.7)
+
+    def test_asyncio_reader_fetches_frames_of_polled_events_in_one_batch(self):
+        injector = Injector([AppBindingsModule, TestBindingsModule, BatchRecordingFrameReaderModule], auto_bind=False)
+        events = ResourceTemplate.event_template()
+        events['events'] += ResourceTemplate.event_template(event_id=2)['events']
+        resource_reader = injector.get(ResourceReader)
+        resource_reader.events = [events]
+        resource_reader.frames = [ResourceTemplate.frame_template(frames=3)]
+
+        worker = injector.create_object(AsyncFrameReaderWorker)
+        asyncio.run(worker._collect_events_async())
+
+        self.assertEqual(injector.get(FrameReader).batches, [['1', '2']])
+        self.assertEqual(worker._recent_events['1'].retrieved_frame_ids, {'0', '1', '2'})
+
+    def test_staged_pipeline_with_parallel_stages(self):
+        injector = Injector([AppBindingsModule, TestBindingsModule], auto_bind=False)
+        config = injector.get(ConfigProvider)
+        config['threading'].update({'decode_threads': '3', 'preprocess_threads': '2', 'stage_queue_size': '1'})
+        config.reread()
+
+        notifications = injector.create_object(Pipeline).run_with(
+            detections={'3': [TestDetection(score=0.6)]},
+            frames=[ResourceTemplate.frame_template(frames=5)],
+        )
+        self.assertAlmostEqual(notifications[0].frame_info.score, 0.6)
+
     def _test_detection_excluded_point(self, detection, exclusion):
         notifications = self._pipeline.run_with(
             detections={
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from injector import Injector
+
+from events_processor.bindings import AppBindingsModule
+from events_processor.bufferpool import ImageBufferPool
+from events_processor.configtools import ConfigProvider
+from events_processor.imagestore import CandidateImageStore
+from events_processor.processor import FrameImageLoader
+from tests.bindings import TestBindingsModule
+from tests.mocks import frame_info_for
+
+
+class ImageBufferPoolTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        injector = Injector([AppBindingsModule, TestBindingsModule], auto_bind=False)
+        self._pool = injector.get(ImageBufferPool)
+        self._loader = injector.get(FrameImageLoader)
+        self._config = injector.get(ConfigProvider)
+        self._store = injector.get(CandidateImageStore)
+
+    def test_released_buffer_is_reused_for_same_shape(self):
+        buffer = self._pool.acquire((10, 20, 3))
+        self._pool.release(buffer)
+
+        self.assertIs(self._pool.acquire((10, 20, 3)), buffer)
+        self.assertIsNot(self._pool.acquire((10, 20, 3)), buffer)
+
+    def test_views_and_duplicates_are_not_pooled(self):
+        buffer = self._pool.acquire((10, 20, 3))
+        self._pool.release(buffer[:5])
+        self._pool.release(buffer)
+        self._pool.release(buffer)
+
+        self.assertEqual(self._pool.stats['pooled'], 1)
+
+    def _frame_info(self, frame_id='1'):
+        return frame_info_for(frame_id=frame_id, image_path=f"frame{frame_id}.jpg")
+
+    def _limit_candidate_store(self, spill_dir=''):
+        self._config['memory'].update({'candidate_store_mb': str(20 / 1024 / 1024), 'candidate_spill_dir': spill_dir})
+        self._config.reread()
+
+    def test_frame_image_returns_to_pool_when_event_resources_released(self):
+        frame_info = self._frame_info()
+        event_info = frame_info.event_info
+        self.assertTrue(self._loader.load(frame_info))
+        image = frame_info.image
+
+        event_info.candidate_frames.append(frame_info)
+        event_info.release_resources()
+
+        self.assertIsNone(frame_info.image)
+        self.assertIs(self._pool.acquire((1000, 1000, 3), np.uint8), image)
+
+    def test_candidate_image_decoded_lazily_from_store(self):
+        frame_info = self._frame_info()
+        self.assertTrue(self._store.put(frame_info))
+
+        self.assertTrue(self._loader.ensure_full_resolution(frame_info))
+        self.assertEqual(frame_info.image.shape, (1000, 1000, 3))
+
+        frame_info.release_stored_image()
+        self.assertEqual(self._store.stored_bytes, 0)
+        self.assertIsNone(self._store.get(frame_info))
+
+    def test_candidate_store_drops_oldest_over_budget(self):
+        self._limit_candidate_store()
+        frames = [self._frame_info(str(i)) for i in range(2)]
+        for frame_info in frames:
+            self._store.put(frame_info)
+
+        self.assertIsNone(self._store.get(frames[0]))
+        self.assertEqual(self._store.get(frames[1]), b'jpeg:frame1.jpg')
+
+    def test_candidate_store_spills_to_disk_over_budget(self):
+        with tempfile.TemporaryDirectory() as spill_dir:
+            self._limit_candidate_store(spill_dir)
+            frames = [self._frame_info(str(i)) for i in range(2)]
+            for frame_info in frames:
+                self._store.put(frame_info)
+
+            self.assertEqual(self._store.get(frames[0]), b'jpeg:frame0.jpg')
+            frames[0].release_stored_image()
+            self.assertEqual(os.listdir(spill_dir), [])
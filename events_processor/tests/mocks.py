@@ -1,7 +1,7 @@
 import json
 import time
 from dataclasses import dataclass
-from typing import Any, Iterable, Optional
+from typing import Any, Iterable, Optional, List
 
 import numpy as np
 from injector import inject
@@ -14,6 +14,17 @@ from events_processor.preprocessor import RotatingPreprocessor
 from events_processor.shapeutils import bounding_box
 
 
+def event_info_for(width=1000, height=1000, event_id='1', monitor_id='1', **event_json) -> EventInfo:
+    return EventInfo(event_json={'Id': event_id, 'MonitorId': monitor_id, 'Width': str(width), 'Height': str(height),
+                                 **event_json})
+
+
+def frame_info_for(event_info: Optional[EventInfo] = None, frame_id='1', image_path='', **fields) -> FrameInfo:
+    event_info = event_info if event_info is not None else event_info_for()
+    return FrameInfo({'FrameId': frame_id, 'EventId': event_info.event_id},
+                     {'Id': event_info.monitor_id, 'Name': 'SomeMonitor'}, image_path, event_info, **fields)
+
+
 class TestDetector(Detector):
     @inject
     def __init__(self,
@@ -29,9 +40,9 @@ class TestDetector(Detector):
         event_id = frame_info.event_id
         frame_id = frame_info.frame_id
 
-        box = self._alarm_box_reader.read(event_id, frame_id, self._config.excluded_zone_prefix)
-        if box:
-            frame_info.alarm_box = bounding_box(self._preprocessor.transform_frame_points(frame_info, box.points))
+        boxes = self._alarm_box_reader.read(event_id, frame_id, self._config.excluded_zone_prefix)
+        frame_info.alarm_boxes = [bounding_box(self._preprocessor.transform_frame_points(frame_info, box.points))
+                                  for box in boxes]
         frame_info.detections = self.detections.get(event_id, {}).get(frame_id, [])
 
 
@@ -40,8 +51,10 @@ class TestResourceReader(ResourceReader):
         self._event_list_invocation = None
         self.events = []
         self.frames = []
+        self.urls = []
 
     def read(self, url):
+        self.urls.append(url)
         response = Response()
         response.status_code = 200
 
@@ -52,6 +65,9 @@ class TestResourceReader(ResourceReader):
             else:
                 self._event_list_invocation = min(len(self.events) - 1, self._event_list_invocation + 1)
             content = self.events[self._event_list_invocation]
+        elif url.find('/api/frames') != -1:
+            frames_json = self.frames[self._event_list_invocation]['event']['Frame']
+            content = {'frames': [{'Frame': frame_json} for frame_json in frames_json]}
         elif url.find('/api/events') != -1:
             content = self.frames[self._event_list_invocation]
 
@@ -74,11 +90,18 @@ class TestImageReader(ImageReader):
     def __init__(self):
         pass
 
-    def read(self, file_name: str) -> Any:
-        img = np.zeros((1000, 1000, 3), np.uint8)
+    def read(self, file_name: str, reduction: int = 1, dst: Any = None) -> Any:
+        shape = (1000 // reduction, 1000 // reduction, 3)
+        img = dst if dst is not None and dst.shape == shape else np.zeros(shape, np.uint8)
         img[::] = (255, 255, 255)
         return img
 
+    def read_encoded(self, file_name: str) -> Optional[bytes]:
+        return f"jpeg:{file_name}".encode()
+
+    def decode(self, data: bytes, reduction: int = 1) -> Any:
+        return self.read(data.decode(), reduction)
+
 
 class TestTime(SystemTime):
     def __init__(self):
@@ -98,10 +121,10 @@ class TestZoneReader(ZoneReader):
 
 class TestAlarmBoxReader(AlarmBoxReader):
     def __init__(self):
-        self.box: Optional[Rect] = None
+        self.boxes: List[Rect] = []
 
-    def read(self, event_id: str, frame_id: str, excl_zone_prefix) -> Optional[Rect]:
-        return self.box
+    def read(self, event_id: str, frame_id: str, excl_zone_prefix) -> List[Rect]:
+        return list(self.boxes)
 
 
 class TestMonitorReader(MonitorReader):
@@ -118,6 +141,44 @@ class TestNoOpEngine(Engine):
         return 0
 
 
+class TestRecordingEngine(Engine):
+    def __init__(self):
+        self.images = []
+
+    def detect(self, img, threshold):
+        self.images.append(img)
+        return []
+
+    def get_pending_processing_seconds(self) -> float:
+        return 0
+
+
+class TestCandidate:
+    def __init__(self, bounding_box, score=0.9, label_id=0):
+        self.bounding_box = np.array(bounding_box)
+        self.score = score
+        self.label_id = label_id
+
+
+class TestTensorEngine(Engine):
+    def __init__(self):
+        self.tensors = []
+        self.candidates = []
+
+    def detect(self, img, threshold):
+        raise AssertionError("image path used for tensor engine")
+
+    def input_shape(self):
+        return 300, 300
+
+    def detect_tensor(self, tensor, threshold):
+        self.tensors.append(tensor.copy())
+        return self.candidates
+
+    def get_pending_processing_seconds(self) -> float:
+        return 0
+
+
 class Response:
     pass
 
@@ -42,7 +42,7 @@ class ResourceTemplate:
         }
 
     @classmethod
-    def frame_template(cls, event_id=1, frames=0, end_time=None):
+    def frame_template(cls, event_id=1, frames=0, end_time=None, scores=None):
         return {
             'event': {
                 'Event': cls.event_template(event_id, end_time)['events'][0]['Event'],
@@ -53,6 +53,7 @@ class ResourceTemplate:
                         'Type': 'Alarm',
                         'TimeStamp': '2019-08-08 10:00:00',
                         'EventId': str(event_id),
+                        'Score': str(scores[x] if scores else 0),
                     } for x in range(frames)
                 ],
                 'Monitor': {
@@ -96,7 +97,7 @@ class Pipeline:
         frames = frames or (ResourceTemplate.frame_template(frames=1),)
 
         self._zone_reader.zones = zones
-        self._alarm_box_reader.box = alarm_box
+        self._alarm_box_reader.boxes = [alarm_box] if alarm_box else []
         self._resource_reader.events = events
         self._resource_reader.frames = frames
         self._detector.detections = {'1': detections}
@@ -114,3 +115,7 @@ class Pipeline:
         time.sleep(0.2)
 
         return list(self._sender.notifications)
+
+    @property
+    def requested_urls(self):
+        return list(self._resource_reader.urls)
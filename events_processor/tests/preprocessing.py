@@ -0,0 +1,80 @@
+import unittest
+
+import cv2
+import numpy as np
+from injector import Injector
+
+from events_processor.bindings import AppBindingsModule
+from events_processor.configtools import ConfigProvider
+from events_processor.models import Point, Rect
+from events_processor.preprocessor import RotatingPreprocessor
+from tests.bindings import TestBindingsModule
+from tests.mocks import frame_info_for, event_info_for
+
+
+class PreprocessingTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        injector = Injector([AppBindingsModule, TestBindingsModule], auto_bind=False)
+        self._config = injector.get(ConfigProvider)
+        self._preprocessor = injector.get(RotatingPreprocessor)
+
+    def _rotate(self, angle):
+        self._config['rotating_preprocessor'].update({'rotate1': str(angle)})
+        self._config.reread()
+
+    def test_transform_points_matches_rotation_matrix(self):
+        self._rotate(30)
+        points = [Point(0, 0), Point(999, 0), Point(500, 250), Point(0, 499)]
+
+        transformed = self._preprocessor.transform_points('1', 1000, 500, points)
+
+        matrix = RotatingPreprocessor._get_rotation_matrix(30, 1000, 500)[2]
+        expected = [Point(*(int(round(v)) for v in matrix.dot((p.x, p.y, 1)))) for p in points]
+        self.assertEqual(list(transformed), expected)
+
+    def test_transform_points_without_rotation_is_identity(self):
+        points = (Point(1, 2), Point(3, 4))
+        self.assertEqual(self._preprocessor.transform_points('1', 1000, 500, points), points)
+
+    def test_rotation_matrix_is_cached(self):
+        RotatingPreprocessor._get_rotation_matrix.cache_clear()
+        self._rotate(45)
+        for _ in range(3):
+            self._preprocessor.transform_coords('1', 1000, 500, np.array([[10, 10]]))
+        self.assertEqual(RotatingPreprocessor._get_rotation_matrix.cache_info().misses, 1)
+
+    def _frame_info(self, image):
+        return frame_info_for(event_info_for(400, 300), image=image)
+
+    def test_right_angle_rotation_fast_path(self):
+        image = np.arange(12 * 7 * 3, dtype=np.uint8).reshape((12, 7, 3))
+        np.testing.assert_array_equal(RotatingPreprocessor.rotate_and_expand_image(image, 90), np.rot90(image))
+        np.testing.assert_array_equal(RotatingPreprocessor.rotate_and_expand_image(image, -90), np.rot90(image, -1))
+
+    def test_full_turn_rotation_is_no_op(self):
+        image = np.arange(12 * 7 * 3, dtype=np.uint8).reshape((12, 7, 3))
+        for angle in (0, 360, -360, 720):
+            np.testing.assert_array_equal(RotatingPreprocessor.rotate_and_expand_image(image, angle), image)
+
+        dst = np.zeros_like(image)
+        self.assertIs(RotatingPreprocessor.rotate_and_expand_image(image, 360, dst=dst), dst)
+        np.testing.assert_array_equal(dst, image)
+
+    def test_region_mode_warps_only_requested_rect(self):
+        self._config['rotating_preprocessor'].update({'rotate1': '20', 'mode1': 'regions', 'interpolation1': 'linear'})
+        self._config.reread()
+        (y, x) = np.mgrid[0:300, 0:400]
+        image = np.dstack([x % 256, y % 256, (x + y) % 256]).astype(np.uint8)
+
+        frame_info = self._frame_info(image)
+        self._preprocessor.preprocess(frame_info)
+        rotated = RotatingPreprocessor.rotate_and_expand_image(image, 20, cv2.INTER_LINEAR)
+
+        self.assertIs(frame_info.image, image)
+        self.assertEqual(self._preprocessor.image_size(frame_info), rotated.shape[1::-1])
+        rect = Rect(150, 120, 250, 200)
+        region = self._preprocessor.extract_region(frame_info, rect)
+        expected = rotated[rect.top:rect.bottom, rect.left:rect.right]
+        self.assertEqual(region.shape, expected.shape)
+        self.assertLessEqual(np.abs(region.astype(int) - expected).max(), 1)
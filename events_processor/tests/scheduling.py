@@ -0,0 +1,40 @@
+import unittest
+
+from events_processor.models import FramePriorityQueue, FrameInfo, EventInfo
+
+
+class FramePriorityQueueTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self._queue = FramePriorityQueue()
+        self._events = [EventInfo(event_json={'Id': str(i)}) for i in range(2)]
+
+    def _frame(self, event_info, frame_id, score):
+        frame_json = {'FrameId': str(frame_id), 'EventId': event_info.event_id, 'Score': str(score)}
+        return FrameInfo(frame_json, {}, '', event_info)
+
+    def test_highest_motion_score_first(self):
+        self._queue.put_many(self._frame(self._events[0], i, score) for (i, score) in enumerate((5, 20, 10)))
+        self.assertEqual([self._queue.get().frame_id for _ in range(3)], ['1', '2', '0'])
+
+    def test_events_served_round_robin_with_highest_motion_first_within_event(self):
+        self._queue.put_many([self._frame(self._events[0], 0, 30), self._frame(self._events[0], 1, 50),
+                              self._frame(self._events[1], 2, 4), self._frame(self._events[0], 3, 40),
+                              self._frame(self._events[1], 4, 5)])
+        self.assertEqual([self._queue.get().frame_id for _ in range(5)], ['1', '4', '3', '2', '0'])
+
+    def test_stop_marker_served_first(self):
+        self._queue.put_many([self._frame(self._events[0], 0, 30), None])
+        self.assertIsNone(self._queue.get())
+        self.assertEqual(self._queue.get().frame_id, '0')
+
+    def test_cancel_event_drops_only_its_frames(self):
+        self._queue.put_many([self._frame(self._events[0], 0, 5), self._frame(self._events[1], 1, 10),
+                              self._frame(self._events[0], 2, 15)])
+
+        cancelled = self._queue.cancel_event(self._events[0])
+
+        self.assertEqual(sorted(f.frame_id for f in cancelled), ['0', '2'])
+        self.assertEqual(self._queue.qsize(), 1)
+        self.assertEqual(self._queue.get().frame_id, '1')
+        self.assertEqual(self._queue.cancel_event(self._events[0]), [])
@@ -0,0 +1,36 @@
+import unittest
+
+from injector import Injector
+
+from events_processor.bindings import AppBindingsModule
+from events_processor.models import Rect, Detection
+from events_processor.suppression import DuplicateDetectionSuppressor
+from tests.bindings import TestBindingsModule
+from tests.mocks import frame_info_for
+
+
+class DuplicateSuppressionTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        injector = Injector([AppBindingsModule, TestBindingsModule], auto_bind=False)
+        self._suppressor = injector.get(DuplicateDetectionSuppressor)
+
+    def _suppressed(self, *detections):
+        frame_info = frame_info_for()
+        frame_info.detections = list(detections)
+        self._suppressor.suppress_duplicates(frame_info)
+        return frame_info.detections
+
+    def test_overlapping_duplicate_with_lower_score_is_dropped(self):
+        best = Detection(Rect(100, 100, 200, 300), 0.9, 0)
+        self.assertEqual(self._suppressed(Detection(Rect(110, 105, 205, 310), 0.6, 0), best), [best])
+
+    def test_box_contained_in_higher_scored_box_is_dropped(self):
+        best = Detection(Rect(100, 100, 300, 500), 0.9, 0)
+        self.assertEqual(self._suppressed(best, Detection(Rect(120, 120, 180, 200), 0.5, 0)), [best])
+
+    def test_different_labels_and_separate_boxes_are_kept(self):
+        detections = [Detection(Rect(100, 100, 200, 300), 0.9, 0),
+                      Detection(Rect(100, 100, 200, 300), 0.8, 2),
+                      Detection(Rect(400, 100, 500, 300), 0.7, 0)]
+        self.assertEqual(self._suppressed(*detections), detections)